@@ -1,17 +1,24 @@
-import openai
 import base64
+import io
 import json
-from clarifai_grpc.channel.clarifai_channel import ClarifaiChannel
-from clarifai_grpc.grpc.api import resources_pb2, service_pb2, service_pb2_grpc
-from clarifai_grpc.grpc.api.status import status_code_pb2
 import ast
-import re
-from dotenv import load_dotenv
+import math
 import os
+import re
+import threading
+import time
+from collections import namedtuple
+
+from PIL import Image
 
-load_dotenv()
+from controllers import metrics
+from controllers import modelRouter as model_router
+from controllers.hedging import Hedger
+from controllers.openaiClient import AIResponseError, chat_completion
+from controllers.structuredLogging import get_logger
+
+logger = get_logger(__name__)
 
-GPT_API_KEY = os.getenv("OPENAI_API_KEY")
 PAT = 'cace4a264b674174b6587c79a555c4ea'
 USER_ID = 'clarifai'
 APP_ID = 'main'
@@ -20,7 +27,63 @@ APP_ID = 'main'
 MODEL_ID = 'food-item-v1-recognition'
 MODEL_VERSION_ID = 'dfebc169854e429086aceb8368662641'
 
-client = openai.OpenAI(api_key=GPT_API_KEY)
+CLARIFAI_TIMEOUT_SECONDS = float(os.getenv("CLARIFAI_TIMEOUT_SECONDS", 15))
+# Hedging duplicates a PostModelOutputs call that outlives the observed p95 latency.
+CLARIFAI_HEDGING = os.getenv("CLARIFAI_HEDGING", "0") == "1"
+
+clarifai_hedger = Hedger(
+    "clarifai",
+    percentile=float(os.getenv("CLARIFAI_HEDGE_PERCENTILE", 0.95)),
+    default_delay=float(os.getenv("CLARIFAI_HEDGE_DEFAULT_DELAY", 2)),
+    max_hedge_ratio=float(os.getenv("CLARIFAI_MAX_HEDGE_RATIO", 0.1))
+)
+
+# "low" sends a 512px image for a flat 85 tokens; "high" lets GPT see 512px tiles of a larger image;
+# "auto" uses high detail unless it would exceed GPT_VISION_TOKEN_BUDGET.
+VISION_DETAILS = ("low", "high", "auto")
+VISION_DETAIL = os.getenv("GPT_VISION_DETAIL", "low")
+VISION_TOKEN_BUDGET = int(os.getenv("GPT_VISION_TOKEN_BUDGET", 1105))
+VISION_JPEG_QUALITY = int(os.getenv("GPT_VISION_JPEG_QUALITY", 85))
+LOW_DETAIL_SIZE = 512
+LOW_DETAIL_TOKENS = 85
+HIGH_DETAIL_MAX_SIDE = 2048
+HIGH_DETAIL_SHORT_SIDE = 768
+TILE_SIZE = 512
+TILE_TOKENS = 170
+
+VisionImage = namedtuple("VisionImage", ["data_url", "detail", "tokens"])
+
+_stub = None
+_stub_lock = threading.Lock()
+
+
+def get_clarifai_stub():
+    # The clarifai_grpc protobuf stack is slow to import, so it is loaded on the first analysis
+    # and the channel is reused for every request after that.
+    global _stub
+    if _stub is None:
+        with _stub_lock:
+            if _stub is None:
+                from clarifai_grpc.channel.clarifai_channel import ClarifaiChannel
+                from clarifai_grpc.grpc.api import service_pb2_grpc
+                _stub = service_pb2_grpc.V2Stub(ClarifaiChannel.get_grpc_channel())
+    return _stub
+
+
+def warm_imports():
+    # Called in the gunicorn master so the heavy modules are shared by every worker;
+    # no channels or clients are created here.
+    import openai
+    from clarifai_grpc.channel.clarifai_channel import ClarifaiChannel
+    from clarifai_grpc.grpc.api import resources_pb2, service_pb2, service_pb2_grpc
+    from clarifai_grpc.grpc.api.status import status_code_pb2
+
+
+def reset_clients():
+    global _stub
+    _stub = None
+    clarifai_hedger.reset()
+
 
 def decode_base64_to_bytes(base64_str):
     return base64.b64decode(base64_str)
@@ -32,76 +95,145 @@ def encode_image_to_base64(image_path):
 
 
 def analyze_image(image_data):
-    channel = ClarifaiChannel.get_grpc_channel()
-    stub = service_pb2_grpc.V2Stub(channel)
+    from clarifai_grpc.grpc.api import resources_pb2, service_pb2
+    from clarifai_grpc.grpc.api.status import status_code_pb2
+
+    stub = get_clarifai_stub()
 
     metadata = (('authorization', 'Key ' + PAT),)
     userDataObject = resources_pb2.UserAppIDSet(user_id=USER_ID, app_id=APP_ID)
 
     image_data_bytes = decode_base64_to_bytes(image_data)
 
-    post_model_outputs_response = stub.PostModelOutputs(
-        service_pb2.PostModelOutputsRequest(
-            user_app_id=userDataObject,
-            model_id=MODEL_ID,
-            version_id=MODEL_VERSION_ID,
-            inputs=[
-                resources_pb2.Input(
-                    data=resources_pb2.Data(
-                        image=resources_pb2.Image(
-                            base64=image_data_bytes
-                        )
+    request = service_pb2.PostModelOutputsRequest(
+        user_app_id=userDataObject,
+        model_id=MODEL_ID,
+        version_id=MODEL_VERSION_ID,
+        inputs=[
+            resources_pb2.Input(
+                data=resources_pb2.Data(
+                    image=resources_pb2.Image(
+                        base64=image_data_bytes
                     )
                 )
-            ]
-        ),
-        metadata=metadata
+            )
+        ]
     )
 
+    def post_model_outputs():
+        return stub.PostModelOutputs(request, metadata=metadata, timeout=CLARIFAI_TIMEOUT_SECONDS)
+
+    started = time.monotonic()
+    if CLARIFAI_HEDGING:
+        post_model_outputs_response = clarifai_hedger.call(post_model_outputs)
+    else:
+        post_model_outputs_response = post_model_outputs()
+    logger.info("clarifai call", extra={"fields": {
+        "duration_ms": int((time.monotonic() - started) * 1000),
+        "status_code": post_model_outputs_response.status.code
+    }})
+
     if post_model_outputs_response.status.code != status_code_pb2.SUCCESS:
-        print(post_model_outputs_response.status)
+        logger.error("Clarifai PostModelOutputs failed", extra={"fields": {
+            "status": post_model_outputs_response.status.description
+        }})
         raise Exception("Post model outputs failed, status: " + post_model_outputs_response.status.description)
 
     output = post_model_outputs_response.outputs[0]
     return output
 
-def GPT_Analyze(prompt, image_data):
-    try:
-        # Build the messages list.
-        # Here we attach the image_data (base64 string) in the same message.
-        messages = [
-            {
-                "role": "user",
-                "content": prompt,
-                "image": image_data  
-            }
-        ]
-
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=messages,
-            max_tokens=200
-        )
-        result = response.choices[0].message.content.strip()
-
-        first_line = result.split("\n")[0].lower()
-        if "success" not in first_line:
-            return "Error: GPT response does not contain 'success' in the first line."
+def estimate_image_tokens(width, height, detail):
+    # OpenAI's published costing: a flat 85 tokens at low detail; at high detail the image is
+    # fitted within 2048x2048, its short side scaled to 768, and each 512px tile costs 170.
+    if detail == "low":
+        return LOW_DETAIL_TOKENS
+    width, height = high_detail_size(width, height)
+    tiles = math.ceil(width / TILE_SIZE) * math.ceil(height / TILE_SIZE)
+    return LOW_DETAIL_TOKENS + TILE_TOKENS * tiles
+
+
+def high_detail_size(width, height):
+    scale = min(1, HIGH_DETAIL_MAX_SIDE / max(width, height))
+    width, height = width * scale, height * scale
+    if min(width, height) > HIGH_DETAIL_SHORT_SIDE:
+        scale = HIGH_DETAIL_SHORT_SIDE / min(width, height)
+        width, height = width * scale, height * scale
+    return max(1, int(width)), max(1, int(height))
+
+
+def prepare_vision_image(image_path, detail=None, token_budget=None):
+    """Downscale and encode an image once so every GPT sample can reuse the same data URL."""
+    detail = detail or VISION_DETAIL
+    token_budget = token_budget or VISION_TOKEN_BUDGET
+    if detail not in VISION_DETAILS:
+        raise ValueError(f"Unsupported detail '{detail}', expected one of {', '.join(VISION_DETAILS)}")
+
+    with Image.open(image_path) as img:
+        img = img.convert("RGB")
+        if detail != "low" and estimate_image_tokens(img.width, img.height, "high") > token_budget:
+            detail = "low"
+        elif detail == "auto":
+            detail = "high"
+
+        if detail == "low":
+            img.thumbnail((LOW_DETAIL_SIZE, LOW_DETAIL_SIZE))
+        else:
+            img = img.resize(high_detail_size(img.width, img.height))
+
+        buffer = io.BytesIO()
+        img.save(buffer, "JPEG", quality=VISION_JPEG_QUALITY)
+        tokens = estimate_image_tokens(img.width, img.height, detail)
+
+    data_url = "data:image/jpeg;base64," + base64.b64encode(buffer.getvalue()).decode("utf-8")
+    return VisionImage(data_url, detail, tokens)
+
+
+def GPT_Analyze(prompt, image, deadline=None, model=None, plan=None):
+    # image is a VisionImage from prepare_vision_image, or a path to prepare one from.
+    # plan is the request's modelRouter.RoutingPlan, charged with the call's cost.
+    model = model or model_router.STRONG_MODEL
+    if not isinstance(image, VisionImage):
+        image = prepare_vision_image(image)
+
+    messages = [
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": prompt},
+                {"type": "image_url", "image_url": {"url": image.data_url, "detail": image.detail}}
+            ]
+        }
+    ]
+
+    started = time.monotonic()
+    response = chat_completion(
+        deadline=deadline,
+        model=model,
+        messages=messages,
+        max_tokens=200
+    )
+    cost = model_router.record_usage(model, getattr(response, "usage", None), time.monotonic() - started)
+    if plan is not None:
+        plan.spend(cost)
+    metrics.incr("gpt_image_tokens", image.tokens)
+    result = response.choices[0].message.content.strip()
 
-        return result
+    first_line = result.split("\n")[0].lower()
+    if "success" not in first_line:
+        raise AIResponseError("GPT response does not contain 'success' in the first line.")
 
-    except Exception as e:
-        return f"Error: {e}"
+    return result
 
 
-def generate_gpt_prompt(image_path):
+def get_concepts(image_path):
     image_data = encode_image_to_base64(image_path)
-
-    
     response = analyze_image(image_data)
+    return response.data.concepts
 
-    
-    concepts = response.data.concepts
+
+def generate_gpt_prompt(image_path, concepts=None):
+    if concepts is None:
+        concepts = get_concepts(image_path)
     
     filtered_concepts= []
 
@@ -132,12 +264,33 @@ def generate_gpt_prompt(image_path):
                 """
     return prompt
 
+def generate_vision_prompt():
+    # Used when GPT starts before Clarifai has answered, so the prompt cannot list concepts.
+    prompt = """
+
+                Based on the image of the meal, please estimate what the food is and the nutritional information (calories, protein, fat, and carbs) for it. 
+                Provide the result in the following strict format:
+                    success:
+                    {
+                        "name": <guessed dish name>,
+                        "calories": <value>,
+                        "carbohydrates": <value>,
+                        "protein": <value>,
+                        "fat": <value>   
+                    }
+
+                Always say success at the very first line before anything else.
+                You should return only one food item and provide the nutritional values in key:value format for each item. Do not provide any ranges, extra explanation, or punctuation like periods at the end nor annotations (''' the triple qoutes) for json or anything else.
+
+                """
+    return prompt
+
 def convert_to_json(output_str):
     match = re.search(r'\{(.*)\}', output_str, re.DOTALL)
 
     if match:
         extracted_json = '{' + match.group(1) + '}'
-        print(extracted_json)
+        logger.debug("parsed GPT reply", extra={"fields": {"chars": len(extracted_json)}})
         data = json.loads(extracted_json)
         return data
     else:
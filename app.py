@@ -1,58 +1,168 @@
 import json
-import math
 import os
+import time
+import uuid
 from datetime import timedelta, datetime, timezone  # Added timezone
 
 import bcrypt
-import psycopg2
 from PIL import Image
-from flask import Flask, request, jsonify, send_from_directory, render_template
+from dotenv import load_dotenv
+from flask import Blueprint, Flask, current_app, request, jsonify, send_from_directory, render_template
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager, jwt_required, create_access_token, get_jwt_identity, decode_token
-from werkzeug.utils import secure_filename
+from werkzeug.exceptions import RequestEntityTooLarge
+
+# Load .env once, before the modules below read their settings from the environment.
+load_dotenv()
 
 import AI_API as api
+from controllers import analysisPipeline as analysis_pipeline
+from controllers import compression
+from controllers import historyRetention as history_retention
+from controllers import historyCache as history_cache
+from controllers import metrics
+from controllers import modelRouter as model_router
+from controllers import nutritionLookup as nutrition_lookup
+from controllers import singleFlight as single_flight
+from controllers import structuredLogging as structured_logging
+from controllers import uploadValidator as upload_validator
+from controllers.database import get_db_connection
 from controllers.emailController import send_reset_email
+from controllers.openaiClient import AIServiceTimeout, AIServiceUnavailable
 
-app = Flask(__name__, static_folder='assets')
-CORS(app)
+bp = Blueprint('main', __name__)
+logger = structured_logging.get_logger(__name__)
 
 UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
+# Total time an /api/analyze-image request may spend waiting on GPT.
+ANALYZE_BUDGET_SECONDS = float(os.getenv("ANALYZE_BUDGET_SECONDS", 60))
+
+analysis_flight = single_flight.SingleFlight("analysis")
+
+
+class ImageProcessingError(Exception):
+    pass
+
+
+def save_as_jpeg(img, image_path):
+    if img.mode == "RGBA":
+        new_img = Image.new("RGB", img.size, (255, 255, 255))
+        new_img.paste(img, mask=img.split()[3])
+        img = new_img
+    # Written aside and renamed into place: a reader in another worker keeps the complete
+    # file it opened instead of seeing it truncated mid-read.
+    partial_path = f"{image_path}.{os.getpid()}.{uuid.uuid4().hex}"
+    try:
+        img.convert("RGB").save(partial_path, "JPEG")
+        os.replace(partial_path, image_path)
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+
+
+def get_history_version(cur, user_id):
+    cur.execute("SELECT history_version FROM users WHERE id = %s", (user_id,))
+    row = cur.fetchone()
+    return row[0] if row else 0
+
+
+def bump_history_version(cur, user_id):
+    # Runs in the same transaction as the history write so the ETag can never go stale.
+    cur.execute("""
+        UPDATE users
+        SET history_version = history_version + 1
+        WHERE id = %s
+        RETURNING history_version
+    """, (user_id,))
+    row = cur.fetchone()
+    return row[0] if row else 0
+
+
+def history_etag(user_id, version):
+    return f"history-{user_id}-{version}"
+
+
+def fetch_history(cur, user_id):
+    # One statement, so the version and the list are read from the same snapshot.
+    cur.execute("""
+        SELECT u.history_version, h.history_entry
+        FROM users u
+        LEFT JOIN history h ON h.user_id = u.id
+        WHERE u.id = %s
+        ORDER BY h.created_at, h.id
+    """, (user_id,))
+    rows = cur.fetchall()
+    version = rows[0][0] if rows else 0
+    return version, [row[1] for row in rows if row[1] is not None]
+
+
+def history_not_modified(user_id, version):
+    etag = history_etag(user_id, version)
+    matched = next((tag for tag in compression.etag_variants(etag) if request.if_none_match.contains(tag)), None)
+    if not matched:
+        return None
+    response = current_app.response_class(status=304)
+    response.set_etag(matched)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def history_response(user_id, version, history_list):
+    response = jsonify({"history": history_list})
+    response.set_etag(history_etag(user_id, version))
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def create_app():
+    structured_logging.setup_logging()
 
-def get_db_connection():
-    db_config = {
-        "host": os.getenv("DB_HOST"),
-        "dbname": os.getenv("DB_NAME"),
-        "user": os.getenv("DB_USER"),
-        "password": os.getenv("DB_PASSWORD"),
-        "port": os.getenv("DB_PORT", 5432)  # Default to 5432 if not set
-    }
+    jwt_secret = os.getenv("JWT_SECRET")
+    if not jwt_secret:
+        raise Exception("JWT secret not found.")
 
-    if not all(db_config.values()):
-        raise Exception("Database configuration is incomplete. Check .env file.")
+    app = Flask(__name__, static_folder='assets')
+    CORS(app)
 
-    return psycopg2.connect(**db_config)
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+    app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+    app.config['JWT_SECRET_KEY'] = jwt_secret
+    # Werkzeug refuses bodies over this size before reading them.
+    app.config['MAX_CONTENT_LENGTH'] = upload_validator.MAX_UPLOAD_BYTES
+    JWTManager(app)
+    compression.init_app(app)
+    structured_logging.init_app(app)
 
+    app.register_blueprint(bp)
+    return app
 
-JWT_SECRET = os.getenv("JWT_SECRET")
-if not JWT_SECRET:
-    raise Exception("JWT secret not found.")
 
-app.config['JWT_SECRET_KEY'] = JWT_SECRET
-jwt_manager = JWTManager(app)
+@bp.app_errorhandler(RequestEntityTooLarge)
+def request_too_large(e):
+    metrics.incr("upload_rejected")
+    metrics.incr("upload_rejected_too_large")
+    return jsonify({"error": f"Upload exceeds the {upload_validator.MAX_UPLOAD_BYTES // (1024 * 1024)} MB limit."}), 413
 
 
 # Backend server can be headless, might not need
-@app.route('/')
+@bp.route('/')
 def serve_index():
     return jsonify({"message": "functional"}), 200
 
 
-@app.route('/signup', methods=['POST'])
+@bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    return jsonify({
+        "counters": metrics.snapshot(),
+        "nutrition_lookup": nutrition_lookup.stats(),
+        "history_cache": history_cache.stats(),
+        "clarifai_hedging": api.clarifai_hedger.stats(),
+        "model_routing": model_router.stats()
+    }), 200
+
+
+@bp.route('/signup', methods=['POST'])
 def signup():
     data = request.get_json()
     username = data.get("username")
@@ -95,11 +205,11 @@ def signup():
         }), 201
 
     except Exception as e:
-        print("Error during signup:", e)
+        logger.exception("Error during signup")
         return jsonify({"error": "Internal server error"}), 500
 
 
-@app.route('/login', methods=['POST'])
+@bp.route('/login', methods=['POST'])
 def login():
     data = request.get_json()
     email = data.get("email")
@@ -139,17 +249,17 @@ def login():
         }), 200
 
     except Exception as e:
-        print("Error during login:", e)
+        logger.exception("Error during login")
         return jsonify({"error": "Server error"}), 500
 
 
-@app.route('/api/auth-check', methods=['GET'])
+@bp.route('/api/auth-check', methods=['GET'])
 @jwt_required()
 def auth_check():
     return jsonify({"message": "Valid token", "user": get_jwt_identity()}), 200
 
 
-@app.route('/api/analyze-image', methods=['POST'])
+@bp.route('/api/analyze-image', methods=['POST'])
 @jwt_required()
 def analyze_image():
     try:
@@ -160,86 +270,88 @@ def analyze_image():
         if file.filename == '':
             return jsonify({"error": "No file selected."}), 400
 
-        filename = secure_filename(file.filename)
-        filename_without_ext = os.path.splitext(filename)[0]
-        jpeg_filename = f"{filename_without_ext}.jpeg"
-        image_path = os.path.join(app.config['UPLOAD_FOLDER'], jpeg_filename)
-        original_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        # Lets the client trade tokens (latency and cost) for detail per request.
+        detail = request.form.get('detail')
+        if detail and detail not in api.VISION_DETAILS:
+            return jsonify({"error": f"Invalid detail, expected one of {', '.join(api.VISION_DETAILS)}"}), 400
 
         # Ensure upload folder exists
-        os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-
-        file.save(original_path)
+        os.makedirs(current_app.config['UPLOAD_FOLDER'], exist_ok=True)
 
         try:
-            img = Image.open(original_path)
-            if img.mode == "RGBA":
-                new_img = Image.new("RGB", img.size, (255, 255, 255))
-                new_img.paste(img, mask=img.split()[3])
-                img = new_img
-            img = img.convert("RGB")
-            img.save(image_path, "JPEG")
-            os.remove(original_path)
-        except Exception as e:
-            return jsonify({"error": "Image processing failed.", "details": str(e)}), 500
-
-        results = []
-        prompt = api.generate_gpt_prompt(image_path)
-        for i in range(4):
+            img = upload_validator.open_upload(file)
+        except upload_validator.UploadRejected as e:
+            return jsonify({"error": e.message}), e.status
+
+        # Client retries of the same photo share the analysis already in flight, and only
+        # the leader decodes and writes the JPEG. Without SINGLE_FLIGHT_DIR each worker has
+        # its own leader, so the content-named file is replaced atomically, never rewritten.
+        flight_key = single_flight.hash_stream(file.stream, detail, analysis_pipeline.PIPELINE_MODE)
+        image_path = os.path.join(current_app.config['UPLOAD_FOLDER'], f"{flight_key}.jpeg")
+        deadline = time.monotonic() + ANALYZE_BUDGET_SECONDS
+
+        def run_analysis():
             try:
-                print(f"Processing image: {image_path}")  # Debug
-                
-                print(f"Calling GPT API with prompt: {prompt}")  # Debug
-                result = api.GPT_Analyze(prompt, image_path)
-                json_data = api.convert_to_json(result)
-                results.append(json_data)
+                save_as_jpeg(img, image_path)
             except Exception as e:
-                return jsonify({"error": f"AI API call failed on iteration {i + 1}", "details": str(e)}), 500
+                raise ImageProcessingError(str(e)) from e
+            return analysis_pipeline.analyze(image_path, deadline, detail=detail)
 
-        if not results:
-            return jsonify({"error": "AI API did not return any results."}), 500
-
-        averaged_result = {}
         try:
-            for key in results[0]:
-                values = [res[key] for res in results if isinstance(res[key], (int, float))]
-                if values:
-                    averaged_result[key] = math.ceil(sum(values) / len(values))
-                else:
-                    averaged_result[key] = results[0][key]
-        except Exception as e:
+            result = analysis_flight.do(flight_key, run_analysis)
+        except ImageProcessingError as e:
+            return jsonify({"error": "Image processing failed.", "details": str(e)}), 500
+        except AIServiceUnavailable as e:
+            return jsonify({"error": "AI service is temporarily unavailable", "details": str(e)}), 503
+        except AIServiceTimeout as e:
+            return jsonify({"error": "AI service timed out", "details": str(e)}), 504
+        except analysis_pipeline.SampleError as e:
+            return jsonify({"error": f"AI API call failed on iteration {e.iteration}", "details": str(e)}), 500
+        except analysis_pipeline.AveragingError as e:
             return jsonify({"error": "Averaging process failed", "details": str(e)}), 500
 
-        return jsonify(averaged_result)
+        return jsonify(result)
+    except RequestEntityTooLarge:
+        raise
     except Exception as e:
         return jsonify({"error": "Unexpected server error", "details": str(e)}), 500
 
 
-@app.route('/history', methods=['GET', 'POST'])
+@bp.route('/history', methods=['GET', 'POST'])
 @jwt_required()
 def manage_history():
     user_id = get_jwt_identity()
 
-    conn = get_db_connection()
-    cur = conn.cursor()
-
     if request.method == 'GET':
         try:
-            cur.execute("""
-                SELECT history_entry
-                FROM history
-                WHERE user_id = %s
-            """, (user_id,))
-            result = cur.fetchall()
+            # With a shared cache backend its version is authoritative, so 304s and cache
+            # hits are answered without touching Postgres.
+            entry = history_cache.current(user_id)
+            if entry is not None:
+                response = history_not_modified(user_id, entry["version"])
+                if response is None and entry["history"] is not None:
+                    response = history_response(user_id, entry["version"], entry["history"])
+                if response is not None:
+                    return response
+
+            conn = get_db_connection()
+            cur = conn.cursor()
+
+            version = get_history_version(cur, user_id)
+            response = history_not_modified(user_id, version)
+            if response is None:
+                history_list = history_cache.get(user_id, version)
+                if history_list is None:
+                    version, history_list = fetch_history(cur, user_id)
+                    history_cache.put(user_id, version, history_list)
+                response = history_response(user_id, version, history_list)
 
             cur.close()
             conn.close()
-
-            history_list = [row[0] for row in result] if result else []
-            return jsonify({"history": history_list}), 200
+            return response
 
         except Exception as e:
-            print(f"Error fetching user history: {e}")
+            logger.exception("Error fetching user history")
             if 'cur' in locals():
                 cur.close()
             if 'conn' in locals():
@@ -248,6 +360,9 @@ def manage_history():
 
     elif request.method == 'POST':
         try:
+            conn = get_db_connection()
+            cur = conn.cursor()
+
             data = request.get_json()
             new_entry = data.get("history_entry")
             if not new_entry or not isinstance(new_entry, dict):
@@ -261,15 +376,18 @@ def manage_history():
                 RETURNING history_entry
             """, (user_id, json.dumps(new_entry)))
             new_entry_result = cur.fetchone()
+            version = bump_history_version(cur, user_id)
 
             conn.commit()
             cur.close()
             conn.close()
 
+            history_cache.append(user_id, version, new_entry_result[0])
+
             return jsonify({"message": "History entry added", "entry": new_entry_result[0]}), 201
 
         except Exception as e:
-            print(f"Error adding user history: {e}")
+            logger.exception("Error adding user history")
             if 'conn' in locals():
                 conn.rollback()
                 if 'cur' in locals():
@@ -278,33 +396,48 @@ def manage_history():
             return jsonify({"error": "Failed to add history"}), 500
 
 
-@app.route('/wipe', methods=['GET'])
+@bp.route('/wipe', methods=['GET'])
 @jwt_required()
 def wipe_history():
     user_id = get_jwt_identity()
+    version = None
 
     try:
         conn = get_db_connection()
         cur = conn.cursor()
 
-        cur.execute("DELETE FROM history WHERE user_id = %s", (user_id,))
-
+        # Deletes in committed batches so a large account never holds row locks for long.
+        # Because of that the version moves before the first batch and again after the last,
+        # even if one fails: neither the old ETag nor a list cached mid-wipe may outlive the
+        # rows already deleted.
+        bump_history_version(cur, user_id)
         conn.commit()
+        try:
+            history_retention.wipe_user_history(conn, user_id)
+        finally:
+            conn.rollback()
+            version = bump_history_version(cur, user_id)
+            conn.commit()
+
         cur.close()
         conn.close()
 
         return jsonify({"message": "success"}), 200
 
     except Exception as e:
-        print(f"Error wiping user history: {e}")
+        logger.exception("Error wiping user history")
         if 'conn' in locals():
             conn.rollback()
             cur.close()
             conn.close()
         return jsonify({"error": "Failed to wipe history"}), 500
 
+    finally:
+        # Without a new version (the final bump failed) the shared entry is dropped outright.
+        history_cache.invalidate(user_id, version)
 
-@app.route('/reset-link', methods=['POST'])
+
+@bp.route('/reset-link', methods=['POST'])
 def reset_link():
     data = request.get_json()
     email = data.get('email')
@@ -341,7 +474,7 @@ def reset_link():
         return jsonify({'message': 'If the email exists, a reset link has been sent'}), 200
 
     except Exception as e:
-        print(f"Error in reset_password: {e}")
+        logger.exception("Error in reset_link")
         if 'conn' in locals():
             conn.rollback()
             if 'cur' in locals():
@@ -350,7 +483,7 @@ def reset_link():
         return jsonify({'error': f'Failed to process reset request: {e}'}), 500
 
 
-@app.route('/reset-password', methods=['GET'])
+@bp.route('/reset-password', methods=['GET'])
 def reset_password():
     token = request.args.get('token')
     if not token:
@@ -384,7 +517,7 @@ def reset_password():
         return render_template('resetPassword.html', token=token)
 
     except Exception as e:
-        print(f"Error verifying reset token: {e}, type: {type(e).__name__}, token: {token}, user_id: {user_id}")
+        logger.exception("Error verifying reset token", extra={"fields": {"error_type": type(e).__name__}})
         if 'conn' in locals():
             if 'cur' in locals():
                 cur.close()
@@ -392,7 +525,7 @@ def reset_password():
         return jsonify({'error': f'Failed to process reset request: {e}'}), 500
 
 
-@app.route('/update-password', methods=['POST'])
+@bp.route('/update-password', methods=['POST'])
 def update_password():
     token = request.form.get('token')
     new_password = request.form.get('password')
@@ -426,7 +559,7 @@ def update_password():
         return "Password reset successfully!"
 
     except Exception as e:
-        print(f"Error in update_password: {e}")
+        logger.exception("Error in update_password")
         if 'conn' in locals():
             conn.rollback()
             if 'cur' in locals():
@@ -435,7 +568,7 @@ def update_password():
         return "Failed to reset password", 500
 
 
-@app.route('/feedback', methods=['POST'])
+@bp.route('/feedback', methods=['POST'])
 def store_feedback():
     try:
         data = request.get_json()
@@ -461,7 +594,7 @@ def store_feedback():
             "message": "Feedback submitted successfully",
         }), 201
     except Exception as e:
-        print(f"Error storing feedback: {e}")
+        logger.exception("Error storing feedback")
         if 'conn' in locals():
             conn.rollback()
             cur.close()
@@ -469,5 +602,7 @@ def store_feedback():
         return jsonify({"error": "Failed to store feedback"}), 500
 
 
+app = create_app()
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,36 @@
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Measures how long a fresh worker takes to import the app and build it,
+# i.e. the time before it can accept traffic.
+RUNS = int(os.getenv("BENCH_RUNS", 10))
+SNIPPET = "import time; t = time.perf_counter(); import app; print(time.perf_counter() - t)"
+
+
+def run_once():
+    env = dict(os.environ)
+    env.setdefault("JWT_SECRET", "benchmark-secret")
+    started = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-c", SNIPPET],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True
+    ).stdout
+    return float(output.strip().splitlines()[-1]), time.perf_counter() - started
+
+
+def main():
+    imports, processes = zip(*(run_once() for _ in range(RUNS)))
+    print(f"runs: {RUNS}")
+    print(f"import app   median {statistics.median(imports) * 1000:.1f} ms, max {max(imports) * 1000:.1f} ms")
+    print(f"process      median {statistics.median(processes) * 1000:.1f} ms, max {max(processes) * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
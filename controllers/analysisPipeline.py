@@ -0,0 +1,225 @@
+import difflib
+import math
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import AI_API as api
+from controllers import metrics
+from controllers import modelRouter as model_router
+from controllers import nutritionLookup as nutrition_lookup
+from controllers.openaiClient import AIServiceTimeout, AIServiceUnavailable
+from controllers.structuredLogging import get_logger, submit
+
+logger = get_logger(__name__)
+
+SAMPLES = 4
+# "sequential" waits for Clarifai before prompting GPT; "overlap" starts both at once.
+PIPELINE_MODE = os.getenv("ANALYZE_PIPELINE", "sequential")
+# How long an overlapped request keeps waiting for Clarifai once every GPT sample is back.
+CONCEPT_GRACE_SECONDS = float(os.getenv("ANALYZE_CONCEPT_GRACE_SECONDS", 0.5))
+RERANK_MIN_CONFIDENCE = 0.89
+RERANK_MATCH_CUTOFF = 0.75
+MAX_WORKERS = int(os.getenv("ANALYZE_MAX_WORKERS", 16))
+
+
+class SampleError(Exception):
+    def __init__(self, iteration, cause):
+        super().__init__(str(cause))
+        self.iteration = iteration
+
+
+class AveragingError(Exception):
+    pass
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="analysis")
+    return _executor
+
+
+def reset_executor():
+    global _executor
+    _executor = None
+
+
+def run_sample(prompt, image, deadline, model=None, plan=None):
+    logger.debug("calling GPT", extra={"fields": {"prompt_chars": len(prompt), "model": model}})
+    result = api.GPT_Analyze(prompt, image, deadline=deadline, model=model, plan=plan)
+    return api.convert_to_json(result)
+
+
+def average_results(results):
+    if not results:
+        raise AveragingError("AI API did not return any results.")
+
+    averaged_result = {}
+    try:
+        for key in results[0]:
+            values = [res[key] for res in results if isinstance(res[key], (int, float))]
+            if values:
+                averaged_result[key] = math.ceil(sum(values) / len(values))
+            else:
+                averaged_result[key] = results[0][key]
+    except Exception as e:
+        raise AveragingError(str(e)) from e
+    return averaged_result
+
+
+def rerank(results, concepts):
+    """Keep the GPT samples whose dish name agrees with a confident Clarifai concept.
+
+    If none agree, every sample is kept: Clarifai is only used to break ties between
+    GPT guesses, never to override them.
+    """
+    names = [concept.name.lower() for concept in concepts if concept.value > RERANK_MIN_CONFIDENCE]
+    if not names:
+        return results
+
+    def agrees(result):
+        dish = str(result.get("name", "")).lower() if isinstance(result, dict) else ""
+        words = dish.split()
+        return any(
+            name in dish or difflib.get_close_matches(name, words, n=1, cutoff=RERANK_MATCH_CUTOFF)
+            for name in names
+        )
+
+    matching = [result for result in results if agrees(result)]
+    if not matching:
+        metrics.incr("analysis_rerank_no_agreement")
+        return results
+    if len(matching) < len(results):
+        metrics.incr("analysis_rerank_filtered")
+    return matching
+
+
+def run_sequential(image_path, deadline, detail=None):
+    concepts = api.get_concepts(image_path)
+    known_dish = nutrition_lookup.lookup(concepts)
+    if known_dish:
+        return known_dish
+
+    prompt = api.generate_gpt_prompt(image_path, concepts)
+    image = api.prepare_vision_image(image_path, detail)
+    plan = model_router.RoutingPlan(deadline)
+    plan.set_concepts(concepts)
+    for i in range(SAMPLES):
+        model = plan.next_model()
+        if model is None:
+            break
+        try:
+            plan.add_result(model, run_sample(prompt, image, deadline, model, plan))
+        except (AIServiceUnavailable, AIServiceTimeout):
+            raise
+        except Exception as e:
+            raise SampleError(i + 1, e) from e
+
+    return average_results(plan.final_results())
+
+
+def run_overlapped(image_path, deadline, detail=None):
+    # GPT samples start on the image straight away instead of waiting for Clarifai,
+    # so latency is roughly max(Clarifai, GPT) rather than their sum.
+    executor = get_executor()
+    clarifai = submit(executor, api.get_concepts, image_path)
+    prompt = api.generate_vision_prompt()
+    image = api.prepare_vision_image(image_path, detail)
+    plan = model_router.RoutingPlan(deadline)
+    models = []
+    for i in range(SAMPLES):
+        model = plan.next_model(pending=i)
+        if model is None:
+            break
+        models.append(model)
+    samples = [submit(executor, run_sample, prompt, image, deadline, model, plan) for model in models]
+
+    concepts = None
+    outstanding = {clarifai, *samples}
+    while any(sample in outstanding for sample in samples):
+        done, outstanding = wait(outstanding, timeout=max(0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+        if not done:
+            for sample in samples:
+                sample.cancel()
+            raise AIServiceTimeout("Request budget exhausted waiting for GPT")
+        if clarifai in done:
+            concepts = _concepts_or_none(clarifai)
+            known_dish = nutrition_lookup.lookup(concepts) if concepts is not None else None
+            if known_dish:
+                for sample in samples:
+                    sample.cancel()
+                return known_dish
+            if concepts is not None:
+                plan.set_concepts(concepts)
+
+    for i, (model, sample) in enumerate(zip(models, samples)):
+        try:
+            plan.add_result(model, sample.result())
+        except (AIServiceUnavailable, AIServiceTimeout):
+            raise
+        except Exception as e:
+            raise SampleError(i + 1, e) from e
+
+    if concepts is None and clarifai in outstanding:
+        wait([clarifai], timeout=min(CONCEPT_GRACE_SECONDS, max(0, deadline - time.monotonic())))
+        if clarifai.done():
+            concepts = _concepts_or_none(clarifai)
+            if concepts is not None:
+                plan.set_concepts(concepts)
+
+    if plan.routing and plan.escalated:
+        _escalate(plan, prompt, image, deadline)
+
+    results = plan.final_results()
+    if concepts is None:
+        metrics.incr("analysis_overlap_concepts_late")
+        return average_results(results)
+
+    metrics.incr("analysis_overlap_concepts_in_time")
+    return average_results(rerank(results, concepts))
+
+
+def _escalate(plan, prompt, image, deadline):
+    # The cheap wave disagreed or Clarifai was unsure: add strong-model samples, but keep
+    # the cheap answers if none of them make it back within the budget.
+    executor = get_executor()
+    pending = {}
+    for _ in range(model_router.ESCALATION_SAMPLES):
+        model = plan.next_model(pending=len(pending))
+        if model is None:
+            break
+        pending[submit(executor, run_sample, prompt, image, deadline, model, plan)] = model
+    if not pending:
+        return
+
+    done, not_done = wait(pending, timeout=max(0, deadline - time.monotonic()))
+    for future in not_done:
+        future.cancel()
+    for future in done:
+        try:
+            plan.add_result(pending[future], future.result())
+        except Exception as e:
+            metrics.incr("router_escalation_failures")
+            logger.warning("Escalated GPT sample failed", extra={"fields": {"error": str(e)}})
+
+
+def _concepts_or_none(future):
+    try:
+        return future.result()
+    except Exception as e:
+        logger.warning("Error fetching Clarifai concepts", extra={"fields": {"error": str(e)}})
+        return None
+
+
+def analyze(image_path, deadline, mode=None, detail=None):
+    if (mode or PIPELINE_MODE) == "overlap":
+        return run_overlapped(image_path, deadline, detail)
+    return run_sequential(image_path, deadline, detail)
@@ -0,0 +1,76 @@
+import gzip
+import os
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from controllers import metrics
+
+MIN_SIZE = int(os.getenv("COMPRESS_MIN_BYTES", 1024))
+GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", 6))
+BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", 5))
+
+COMPRESSIBLE_MIMETYPES = ("application/json",)
+
+
+def available_encodings():
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def choose_encoding(accept_encodings):
+    for encoding in available_encodings():
+        if accept_encodings.quality(encoding) > 0:
+            return encoding
+    return None
+
+
+def etag_variants(etag):
+    # Compressed bodies carry a per-encoding ETag so the strong validator stays byte-exact.
+    return [etag] + [f"{etag}-{encoding}" for encoding in available_encodings()]
+
+
+def compress(data, encoding):
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+
+def compress_response(response):
+    if (
+        response.status_code < 200
+        or response.status_code >= 300
+        or response.direct_passthrough
+        or "Content-Encoding" in response.headers
+        or response.mimetype not in COMPRESSIBLE_MIMETYPES
+    ):
+        return response
+
+    response.vary.add("Accept-Encoding")
+
+    data = response.get_data()
+    if len(data) < MIN_SIZE:
+        return response
+
+    encoding = choose_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+
+    compressed = compress(data, encoding)
+    response.set_data(compressed)
+    response.headers["Content-Encoding"] = encoding
+
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f"{etag}-{encoding}", weak)
+
+    metrics.incr(f"compressed_responses_{encoding}")
+    metrics.incr("compression_bytes_saved", len(data) - len(compressed))
+    return response
+
+
+def init_app(app):
+    app.after_request(compress_response)
@@ -0,0 +1,26 @@
+import os
+import time
+
+import psycopg2
+
+from controllers.structuredLogging import get_logger
+
+logger = get_logger(__name__)
+
+
+def get_db_connection():
+    db_config = {
+        "host": os.getenv("DB_HOST"),
+        "dbname": os.getenv("DB_NAME"),
+        "user": os.getenv("DB_USER"),
+        "password": os.getenv("DB_PASSWORD"),
+        "port": os.getenv("DB_PORT", 5432)  # Default to 5432 if not set
+    }
+
+    if not all(db_config.values()):
+        raise Exception("Database configuration is incomplete. Check .env file.")
+
+    started = time.monotonic()
+    conn = psycopg2.connect(**db_config)
+    logger.debug("database connect", extra={"fields": {"duration_ms": int((time.monotonic() - started) * 1000)}})
+    return conn
@@ -1,11 +1,12 @@
 import os
 import smtplib
+import time
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 
-from dotenv import load_dotenv
+from controllers.structuredLogging import get_logger
 
-load_dotenv()
+logger = get_logger(__name__)
 
 
 def send_reset_email(to_email, reset_link):
@@ -76,12 +77,16 @@ def send_reset_email(to_email, reset_link):
     msg['Subject'] = subject
     msg.attach(MIMEText(html_body, 'html'))
 
+    started = time.monotonic()
     try:
         with smtplib.SMTP(smtp_server, int(smtp_port)) as server:
             server.starttls()
             server.login(smtp_user, smtp_password)
             server.sendmail(smtp_user, to_email, msg.as_string())
 
-        print(f"Reset email successfully sent to {to_email}")
-    except Exception as e:
-        print(f"Failed to send reset email to {to_email}: {e}")
+        logger.info("Reset email sent", extra={"fields": {
+            "to": to_email,
+            "duration_ms": int((time.monotonic() - started) * 1000)
+        }})
+    except Exception:
+        logger.exception("Failed to send reset email", extra={"fields": {"to": to_email}})
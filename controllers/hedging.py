@@ -0,0 +1,116 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from controllers import metrics
+from controllers.structuredLogging import submit
+
+
+class LatencyTracker:
+    def __init__(self, window=200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, fraction, min_samples=20):
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+
+class Hedger:
+    """Runs a call and, if it is slower than the observed percentile, races a duplicate against it.
+
+    Hedges are paid for from a token bucket that refills by ``max_hedge_ratio`` per call, so at
+    most that fraction of calls is ever duplicated, even when the upstream is uniformly slow.
+    """
+
+    def __init__(self, name, percentile=0.95, default_delay=1.0, min_delay=0.05,
+                 max_hedge_ratio=0.1, burst=5, max_workers=8):
+        self.name = name
+        self.percentile = percentile
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+        self.max_hedge_ratio = max_hedge_ratio
+        self.burst = burst
+        self.max_workers = max_workers
+        self.latency = LatencyTracker()
+        self._tokens = burst
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f"{self.name}-hedge")
+        return self._executor
+
+    def reset(self):
+        # The parent's pool threads do not survive a fork.
+        self._executor = None
+
+    def hedge_delay(self):
+        observed = self.latency.percentile(self.percentile)
+        if observed is None:
+            return self.default_delay
+        return max(self.min_delay, observed)
+
+    def _refill(self):
+        # Every call earns a fraction of a hedge, fast or slow, so the cap is a ratio of all calls.
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + self.max_hedge_ratio)
+
+    def _take_token(self):
+        with self._lock:
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    def _timed(self, fn):
+        def run():
+            started = time.monotonic()
+            result = fn()
+            self.latency.add(time.monotonic() - started)
+            return result
+        return run
+
+    def call(self, fn):
+        metrics.incr(f"{self.name}_hedge_requests")
+        self._refill()
+        executor = self._get_executor()
+
+        primary = submit(executor, self._timed(fn))
+        done, _ = wait([primary], timeout=self.hedge_delay())
+        if done or not self._take_token():
+            return primary.result()
+
+        metrics.incr(f"{self.name}_hedges_issued")
+        hedge = submit(executor, self._timed(fn))
+        pending = {primary, hedge}
+        first_error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        metrics.incr(f"{self.name}_hedges_won")
+                    return future.result()
+                first_error = first_error or future.exception()
+        raise first_error
+
+    def stats(self):
+        return {
+            "requests": metrics.get(f"{self.name}_hedge_requests"),
+            "hedges_issued": metrics.get(f"{self.name}_hedges_issued"),
+            "hedges_won": metrics.get(f"{self.name}_hedges_won"),
+            "hedge_rate": metrics.ratio(f"{self.name}_hedges_issued", f"{self.name}_hedge_requests"),
+            "hedge_delay_seconds": round(self.hedge_delay(), 3)
+        }
@@ -0,0 +1,209 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+from controllers import metrics
+from controllers.structuredLogging import get_logger
+
+logger = get_logger(__name__)
+
+MAX_BYTES = int(os.getenv("HISTORY_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+REDIS_URL = os.getenv("HISTORY_CACHE_REDIS_URL")
+# /history trusts the shared entry's version without asking Postgres, so this TTL bounds how
+# long a missed post-commit update (a crashed worker, a failed write) can serve stale data.
+REDIS_TTL_SECONDS = int(os.getenv("HISTORY_CACHE_REDIS_TTL_SECONDS", 60))
+
+# Only moves the shared entry forward: a reader that loaded an older version from the
+# database must not overwrite what a newer write has already stored.
+STORE_IF_NEWER = """
+local current = redis.call('GET', KEYS[1])
+if current and cjson.decode(current)['version'] > tonumber(ARGV[2]) then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[3])
+return 1
+"""
+
+
+class LRUCache:
+    """In-process LRU bounded by the approximate serialized size of its values."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            self._entries.move_to_end(key)
+            return item[0]
+
+    def set(self, key, value, size):
+        with self._lock:
+            self._remove(key)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+                metrics.incr("history_cache_evictions")
+
+    def delete(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def _remove(self, key):
+        item = self._entries.pop(key, None)
+        if item is not None:
+            self.total_bytes -= item[1]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+_local = LRUCache(MAX_BYTES)
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_backend():
+    global _shared
+    if _shared is None and REDIS_URL and redis is not None:
+        with _shared_lock:
+            if _shared is None:
+                _shared = redis.Redis.from_url(REDIS_URL)
+    return _shared
+
+
+def reset_backend():
+    global _shared
+    _shared = None
+
+
+def _redis_key(user_id):
+    return f"history:{user_id}"
+
+
+def _store(user_id, entry, size):
+    if entry["history"] is not None:
+        _local.set(str(user_id), entry, size)
+    shared = get_shared_backend()
+    if shared is not None:
+        try:
+            shared.eval(STORE_IF_NEWER, 1, _redis_key(user_id), json.dumps(entry), entry["version"], REDIS_TTL_SECONDS)
+        except Exception as e:
+            logger.warning("Error writing history cache", extra={"fields": {"error": str(e)}})
+            # An entry left at an older version would still be trusted; make readers go to the database.
+            try:
+                shared.delete(_redis_key(user_id))
+            except Exception as e:
+                logger.warning("Error invalidating history cache", extra={"fields": {"error": str(e)}})
+
+
+def _load_shared(user_id):
+    shared = get_shared_backend()
+    if shared is None:
+        return None
+    try:
+        raw = shared.get(_redis_key(user_id))
+    except Exception as e:
+        logger.warning("Error reading history cache", extra={"fields": {"error": str(e)}})
+        return None
+    if raw is None:
+        return None
+    entry = json.loads(raw)
+    if entry["history"] is not None:
+        _local.set(str(user_id), entry, len(raw))
+    return entry
+
+
+def _usable(entry, version):
+    return entry is not None and entry["version"] == version and entry["history"] is not None
+
+
+def _load(user_id, version):
+    # The local copy may be behind a write made by another worker; the shared backend may not be.
+    entry = _local.get(str(user_id))
+    if not _usable(entry, version):
+        entry = _load_shared(user_id)
+    return entry if _usable(entry, version) else None
+
+
+def current(user_id):
+    """Return the shared backend's entry for the user, or None if there is no shared backend.
+
+    Every history write updates the shared entry after it commits, so its version can stand
+    in for users.history_version. ``history`` is None when only the version is known.
+    """
+    if get_shared_backend() is None:
+        return None
+    entry = _load_shared(user_id)
+    if entry is not None and entry["history"] is not None:
+        metrics.incr("history_cache_hits")
+    return entry
+
+
+def get(user_id, version):
+    """Return the cached history list if it was stored for ``version``, else None."""
+    entry = _load(user_id, version)
+    if entry is not None:
+        metrics.incr("history_cache_hits")
+        return entry["history"]
+    metrics.incr("history_cache_misses")
+    return None
+
+
+def put(user_id, version, history):
+    entry = {"version": version, "history": history}
+    _store(user_id, entry, len(json.dumps(entry)))
+
+
+def append(user_id, version, history_entry):
+    # Write-through: extend the cached list only if it is exactly one version behind;
+    # otherwise another writer got in between and the next read must go to the database.
+    entry = _load(user_id, version - 1)
+    if entry is None:
+        invalidate(user_id, version)
+        return
+    put(user_id, version, entry["history"] + [history_entry])
+
+
+def invalidate(user_id, version=None):
+    """Drop the cached list. Given the new version, the shared backend keeps it without a list,
+    so readers still learn the version without going to the database."""
+    _local.delete(str(user_id))
+    if version is not None:
+        _store(user_id, {"version": version, "history": None}, 0)
+        return
+    shared = get_shared_backend()
+    if shared is not None:
+        try:
+            shared.delete(_redis_key(user_id))
+        except Exception as e:
+            logger.warning("Error invalidating history cache", extra={"fields": {"error": str(e)}})
+
+
+def stats():
+    hits = metrics.get("history_cache_hits")
+    lookups = hits + metrics.get("history_cache_misses")
+    return {
+        "hits": hits,
+        "lookups": lookups,
+        "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+        "entries": len(_local),
+        "bytes": _local.total_bytes,
+        "shared_backend": get_shared_backend() is not None
+    }
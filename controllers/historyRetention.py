@@ -0,0 +1,212 @@
+import argparse
+import gzip
+import os
+import re
+import time
+from datetime import date, datetime, timezone
+
+from psycopg2 import sql
+
+from controllers import historyCache as history_cache
+from controllers.structuredLogging import get_logger, setup_logging
+
+logger = get_logger(__name__)
+
+RETENTION_MONTHS = int(os.getenv("HISTORY_RETENTION_MONTHS", 24))
+MONTHS_AHEAD = int(os.getenv("HISTORY_PARTITION_MONTHS_AHEAD", 3))
+WIPE_BATCH_SIZE = int(os.getenv("HISTORY_WIPE_BATCH_SIZE", 1000))
+ARCHIVE_DIR = os.getenv(
+    "HISTORY_ARCHIVE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'archive')
+)
+
+PARTITION_PATTERN = re.compile(r'^history_(\d{4})_(\d{2})$')
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"history_{month:%Y_%m}"
+
+
+def partition_month(name):
+    match = PARTITION_PATTERN.match(name)
+    if not match:
+        return None
+    return date(int(match.group(1)), int(match.group(2)), 1)
+
+
+def ensure_partitions(cur, today, months_ahead=MONTHS_AHEAD):
+    # Keeps the next few monthly partitions in place; there is no default partition, so an
+    # insert for a month without one would fail.
+    current = date(today.year, today.month, 1)
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        cur.execute(sql.SQL("""
+            CREATE TABLE IF NOT EXISTS {} PARTITION OF history
+            FOR VALUES FROM (%s) TO (%s)
+        """).format(sql.Identifier(partition_name(month))), (month, add_months(month, 1)))
+
+
+def list_partitions(cur):
+    cur.execute("""
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE parent.relname = 'history'
+    """)
+    return [row[0] for row in cur.fetchall()]
+
+
+def list_detached_partitions(cur):
+    # Left behind when an archive run failed after its detach; the next run finishes them.
+    cur.execute("""
+        SELECT relname
+        FROM pg_class
+        WHERE relkind = 'r'
+          AND relname ~ '^history_[0-9]{4}_[0-9]{2}$'
+          AND NOT EXISTS (SELECT 1 FROM pg_inherits WHERE inhrelid = pg_class.oid)
+    """)
+    return [row[0] for row in cur.fetchall()]
+
+
+def expired_partitions(names, today, retention_months=RETENTION_MONTHS):
+    cutoff = add_months(date(today.year, today.month, 1), -retention_months)
+    expired = [name for name in names if partition_month(name) is not None and partition_month(name) < cutoff]
+    return sorted(expired)
+
+
+def detach_partition(conn, cur, name):
+    """Detach a partition without blocking live /history traffic.
+
+    CONCURRENTLY only takes SHARE UPDATE EXCLUSIVE on history, but cannot run in a
+    transaction block. A detach interrupted half-way is left pending and is finalized.
+    """
+    cur.execute("SELECT inhdetachpending FROM pg_inherits WHERE inhrelid = %s::regclass", (name,))
+    row = cur.fetchone()
+    conn.commit()
+    if row is None:
+        return
+
+    mode = "FINALIZE" if row[0] else "CONCURRENTLY"
+    conn.autocommit = True
+    try:
+        cur.execute(sql.SQL("ALTER TABLE history DETACH PARTITION {} " + mode).format(sql.Identifier(name)))
+    finally:
+        conn.autocommit = False
+
+
+def archive_partition(conn, name, archive_dir=ARCHIVE_DIR):
+    """Copy a partition to ``<archive_dir>/<name>.csv.gz``, then detach and drop it.
+
+    Every user who had rows in it gets a new history version, so ETags and cached lists
+    that still include the archived entries stop being served.
+    """
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"{name}.csv.gz")
+    partial_path = path + ".partial"
+
+    cur = conn.cursor()
+    try:
+        with gzip.open(partial_path, 'wb') as archive:
+            cur.copy_expert(
+                sql.SQL("COPY {} TO STDOUT WITH (FORMAT csv, HEADER)").format(sql.Identifier(name)),
+                archive
+            )
+        os.replace(partial_path, path)
+
+        detach_partition(conn, cur, name)
+        # The rows are gone from history now; bump after the detach so no list cached in
+        # between can still hold them under the new version.
+        cur.execute(sql.SQL("""
+            UPDATE users
+            SET history_version = history_version + 1
+            WHERE id IN (SELECT DISTINCT user_id FROM {})
+            RETURNING id, history_version
+        """).format(sql.Identifier(name)))
+        bumped = cur.fetchall()
+        cur.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(name)))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+    finally:
+        cur.close()
+
+    for user_id, version in bumped:
+        history_cache.invalidate(user_id, version)
+    return path
+
+
+def run_retention(conn, today=None, archive_dir=ARCHIVE_DIR):
+    today = today or datetime.now(timezone.utc).date()
+
+    cur = conn.cursor()
+    try:
+        ensure_partitions(cur, today)
+        conn.commit()
+        expired = expired_partitions(list_partitions(cur) + list_detached_partitions(cur), today)
+    finally:
+        cur.close()
+
+    archived = []
+    for name in expired:
+        archived.append(archive_partition(conn, name, archive_dir))
+        logger.info("Archived history partition", extra={"fields": {"partition": name}})
+    return archived
+
+
+def wipe_user_history(conn, user_id, batch_size=WIPE_BATCH_SIZE):
+    """Delete a user's history in batches, committing after each so locks stay short."""
+    cur = conn.cursor()
+    total = 0
+    try:
+        while True:
+            cur.execute("""
+                DELETE FROM history
+                WHERE (id, created_at) IN (
+                    SELECT id, created_at
+                    FROM history
+                    WHERE user_id = %s
+                    LIMIT %s
+                )
+            """, (user_id, batch_size))
+            deleted = cur.rowcount
+            conn.commit()
+            total += deleted
+            if deleted < batch_size:
+                return total
+    finally:
+        cur.close()
+
+
+def main():
+    from dotenv import load_dotenv
+
+    from controllers.database import get_db_connection
+
+    parser = argparse.ArgumentParser(description="Create upcoming history partitions and archive expired ones.")
+    parser.add_argument("--interval", type=int, default=0, help="Repeat every N seconds instead of running once.")
+    args = parser.parse_args()
+
+    load_dotenv()
+    setup_logging()
+    while True:
+        conn = get_db_connection()
+        try:
+            run_retention(conn)
+        finally:
+            conn.close()
+        if not args.interval:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,31 @@
+import threading
+
+_lock = threading.Lock()
+_counters = {}
+
+
+def incr(name, amount=1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def get(name):
+    with _lock:
+        return _counters.get(name, 0)
+
+
+def ratio(numerator, denominator):
+    total = get(denominator)
+    if not total:
+        return 0.0
+    return round(get(numerator) / total, 4)
+
+
+def snapshot():
+    with _lock:
+        return dict(_counters)
+
+
+def reset():
+    with _lock:
+        _counters.clear()
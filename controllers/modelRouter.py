@@ -0,0 +1,157 @@
+import os
+import threading
+import time
+
+from controllers import metrics
+
+# With routing off every sample uses STRONG_MODEL, as before; budgets still apply if set.
+ROUTING_ENABLED = os.getenv("GPT_MODEL_ROUTING", "0") == "1"
+CHEAP_MODEL = os.getenv("GPT_CHEAP_MODEL", "gpt-4o-mini")
+STRONG_MODEL = os.getenv("GPT_STRONG_MODEL", "gpt-4o")
+# Cheap samples taken before deciding whether they agree well enough to skip the strong model.
+CHEAP_SAMPLES = int(os.getenv("GPT_ROUTING_CHEAP_SAMPLES", 2))
+# Below this top Clarifai confidence the image is treated as hard and goes straight to STRONG_MODEL.
+LOW_CONFIDENCE = float(os.getenv("GPT_ROUTING_LOW_CONFIDENCE", 0.9))
+CALORIE_TOLERANCE = float(os.getenv("GPT_ROUTING_CALORIE_TOLERANCE", 0.2))
+# Strong samples an overlapped request adds after its cheap wave escalates.
+ESCALATION_SAMPLES = int(os.getenv("GPT_ROUTING_ESCALATION_SAMPLES", 2))
+REQUEST_COST_BUDGET_USD = float(os.getenv("GPT_REQUEST_COST_BUDGET_USD", 0)) or None
+
+# USD per million (prompt, completion) tokens.
+MODEL_PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+}
+# Used to estimate a call's cost before any usage for that model has been observed.
+DEFAULT_PROMPT_TOKENS = 1000
+DEFAULT_COMPLETION_TOKENS = 150
+
+
+def call_cost(model, prompt_tokens, completion_tokens):
+    prompt_price, completion_price = MODEL_PRICES.get(model, MODEL_PRICES["gpt-4o"])
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+
+def record_usage(model, usage, duration):
+    """Record one completed call in the per-model metrics and return its cost in USD."""
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+    cost = call_cost(model, prompt_tokens, completion_tokens)
+
+    metrics.incr(f"gpt_model_{model}_calls")
+    metrics.incr(f"gpt_model_{model}_latency_ms", int(duration * 1000))
+    metrics.incr(f"gpt_model_{model}_prompt_tokens", prompt_tokens)
+    metrics.incr(f"gpt_model_{model}_completion_tokens", completion_tokens)
+    metrics.incr(f"gpt_model_{model}_cost_micro_usd", int(cost * 1_000_000))
+    return cost
+
+
+def average_latency(model):
+    calls = metrics.get(f"gpt_model_{model}_calls")
+    return metrics.get(f"gpt_model_{model}_latency_ms") / calls / 1000 if calls else 0.0
+
+
+def estimated_cost(model):
+    calls = metrics.get(f"gpt_model_{model}_calls")
+    if calls:
+        return metrics.get(f"gpt_model_{model}_cost_micro_usd") / calls / 1_000_000
+    return call_cost(model, DEFAULT_PROMPT_TOKENS, DEFAULT_COMPLETION_TOKENS)
+
+
+def results_agree(results):
+    names = {str(result.get("name", "")).strip().lower() for result in results}
+    if len(names) > 1:
+        return False
+    calories = [result["calories"] for result in results if isinstance(result.get("calories"), (int, float))]
+    if len(calories) < 2:
+        return True
+    return (max(calories) - min(calories)) <= CALORIE_TOLERANCE * max(max(calories), 1)
+
+
+class RoutingPlan:
+    """Per-request model choice and budget for the GPT samples of one analysis."""
+
+    def __init__(self, deadline=None, cost_budget=None, routing=None):
+        self.deadline = deadline
+        self.cost_budget = REQUEST_COST_BUDGET_USD if cost_budget is None else cost_budget
+        self.routing = ROUTING_ENABLED if routing is None else routing
+        self.escalated = not self.routing
+        self.spent = 0.0
+        self.issued = 0
+        self.results = []
+        self._agreement_checked = False
+        self._lock = threading.Lock()
+
+    def set_concepts(self, concepts):
+        if self.escalated:
+            return
+        top = max((concept.value for concept in concepts), default=0)
+        if top < LOW_CONFIDENCE:
+            metrics.incr("router_low_confidence")
+            self.escalated = True
+
+    def next_model(self, pending=0):
+        """Return the model for the next sample, or None once the request budget is spent.
+
+        ``pending`` counts samples already issued but not yet charged, as when a wave of
+        samples is started in parallel. The first sample of a request is always allowed.
+        """
+        model = STRONG_MODEL if self.escalated else CHEAP_MODEL
+        with self._lock:
+            if self.issued and not self._within_budget(model, pending):
+                metrics.incr("router_budget_stops")
+                return None
+            self.issued += 1
+        return model
+
+    def _within_budget(self, model, pending):
+        if self.cost_budget is not None and self.spent + (pending + 1) * estimated_cost(model) > self.cost_budget:
+            return False
+        return self.deadline is None or self.deadline - time.monotonic() >= average_latency(model)
+
+    def spend(self, cost):
+        with self._lock:
+            self.spent += cost
+
+    def add_result(self, model, result):
+        with self._lock:
+            self.results.append((model, result))
+            cheap = [sample for used, sample in self.results if used == CHEAP_MODEL]
+            if self.escalated or self._agreement_checked or len(cheap) < CHEAP_SAMPLES:
+                return
+            self._agreement_checked = True
+
+        metrics.incr("router_agreement_checks")
+        if results_agree(cheap):
+            metrics.incr("router_agreements")
+        else:
+            metrics.incr("router_escalations")
+            self.escalated = True
+
+    def final_results(self):
+        # Once escalated, cheap samples either disagreed or were taken on a hard image; only
+        # the strong model's answers are averaged if there are any.
+        strong = [result for model, result in self.results if model == STRONG_MODEL]
+        if self.routing and self.escalated and strong:
+            return strong
+        return [result for _, result in self.results]
+
+
+def stats():
+    models = {}
+    for model in {CHEAP_MODEL, STRONG_MODEL}:
+        calls = metrics.get(f"gpt_model_{model}_calls")
+        models[model] = {
+            "calls": calls,
+            "avg_latency_ms": int(average_latency(model) * 1000),
+            "avg_prompt_tokens": metrics.get(f"gpt_model_{model}_prompt_tokens") // calls if calls else 0,
+            "avg_completion_tokens": metrics.get(f"gpt_model_{model}_completion_tokens") // calls if calls else 0,
+            "cost_usd": metrics.get(f"gpt_model_{model}_cost_micro_usd") / 1_000_000,
+        }
+    return {
+        "routing_enabled": ROUTING_ENABLED,
+        "models": models,
+        "agreement_rate": metrics.ratio("router_agreements", "router_agreement_checks"),
+        "escalations": metrics.get("router_escalations"),
+        "budget_stops": metrics.get("router_budget_stops"),
+    }
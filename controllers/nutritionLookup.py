@@ -0,0 +1,87 @@
+import csv
+import difflib
+import os
+import re
+import threading
+
+from controllers import metrics
+
+NUTRITION_FILE = os.getenv(
+    "NUTRITION_FILE",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'assets', 'data', 'nutrition.csv')
+)
+MIN_CONFIDENCE = float(os.getenv("NUTRITION_LOOKUP_MIN_CONFIDENCE", 0.95))
+MATCH_CUTOFF = float(os.getenv("NUTRITION_LOOKUP_MATCH_CUTOFF", 0.88))
+
+MACRO_KEYS = ("calories", "carbohydrates", "protein", "fat")
+
+_index = None
+_names = None
+_lock = threading.Lock()
+
+
+def normalize_name(name):
+    return re.sub(r'[^a-z0-9 ]+', '', name.lower().replace('-', ' ').replace('_', ' ')).strip()
+
+
+def load_index(path=None):
+    # Each alias points at the same (name, calories, carbohydrates, protein, fat) tuple,
+    # so the whole table is a single dict of small tuples.
+    index = {}
+    with open(path or NUTRITION_FILE, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            entry = (row["name"],) + tuple(int(row[key]) for key in MACRO_KEYS)
+            keys = [row["name"]] + [alias for alias in row.get("aliases", "").split("|") if alias]
+            for key in keys:
+                index.setdefault(normalize_name(key), entry)
+    return index
+
+
+def _get_index():
+    global _index, _names
+    if _index is None:
+        with _lock:
+            if _index is None:
+                index = load_index()
+                _names = list(index)
+                _index = index
+    return _index
+
+
+def find_dish(name):
+    index = _get_index()
+    key = normalize_name(name)
+    entry = index.get(key)
+    if entry is None:
+        matches = difflib.get_close_matches(key, _names, n=1, cutoff=MATCH_CUTOFF)
+        if matches:
+            entry = index[matches[0]]
+    if entry is None:
+        return None
+    return dict(zip(("name",) + MACRO_KEYS, entry))
+
+
+def lookup(concepts):
+    """Return macros for the top Clarifai concept, or None when GPT should be asked."""
+    metrics.incr("nutrition_lookup_requests")
+
+    top = max(concepts, key=lambda concept: concept.value, default=None)
+    if top is None or top.value < MIN_CONFIDENCE:
+        metrics.incr("nutrition_lookup_misses")
+        return None
+
+    dish = find_dish(top.name)
+    if dish is None:
+        metrics.incr("nutrition_lookup_misses")
+        return None
+
+    metrics.incr("nutrition_lookup_hits")
+    return dish
+
+
+def stats():
+    return {
+        "requests": metrics.get("nutrition_lookup_requests"),
+        "hits": metrics.get("nutrition_lookup_hits"),
+        "hit_rate": metrics.ratio("nutrition_lookup_hits", "nutrition_lookup_requests"),
+    }
@@ -0,0 +1,191 @@
+import os
+import random
+import threading
+import time
+
+from controllers import metrics
+from controllers.structuredLogging import get_logger
+
+logger = get_logger(__name__)
+
+CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", 5))
+READ_TIMEOUT = float(os.getenv("OPENAI_READ_TIMEOUT", 30))
+MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", 20))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", 10))
+KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", 30))
+MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", 2))
+RETRY_BASE_DELAY = float(os.getenv("OPENAI_RETRY_BASE_DELAY", 0.5))
+RETRY_MAX_DELAY = float(os.getenv("OPENAI_RETRY_MAX_DELAY", 4))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("OPENAI_BREAKER_FAILURE_THRESHOLD", 5))
+BREAKER_RESET_SECONDS = float(os.getenv("OPENAI_BREAKER_RESET_SECONDS", 30))
+
+
+class AIServiceError(Exception):
+    pass
+
+
+class AIServiceTimeout(AIServiceError):
+    pass
+
+
+class AIServiceUnavailable(AIServiceError):
+    pass
+
+
+class AIResponseError(AIServiceError):
+    pass
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures and lets a single probe through once the reset window passes."""
+
+    def __init__(self, failure_threshold, reset_seconds, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self.clock() - self.opened_at < self.reset_seconds or self.probing:
+                return False
+            self.probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.failure_threshold:
+                self.opened_at = self.clock()
+            self.probing = False
+
+
+breaker = CircuitBreaker(BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_SECONDS)
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                # openai and httpx pull in a large dependency tree; import them on the first GPT call.
+                import httpx
+                import openai
+
+                http_client = httpx.Client(
+                    limits=httpx.Limits(
+                        max_connections=MAX_CONNECTIONS,
+                        max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                        keepalive_expiry=KEEPALIVE_EXPIRY
+                    ),
+                    timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT)
+                )
+                # Retries are handled below so they can respect the request deadline and the breaker.
+                _client = openai.OpenAI(
+                    api_key=os.getenv("OPENAI_API_KEY"),
+                    http_client=http_client,
+                    max_retries=0
+                )
+    return _client
+
+
+def reset_client():
+    # After a fork the parent's connections belong to the parent; build a fresh pool on next use.
+    global _client
+    _client = None
+
+
+def _is_retryable(error):
+    import openai
+
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError, openai.RateLimitError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+def _retry_delay(attempt, error):
+    retry_after = None
+    response = getattr(error, "response", None)
+    if response is not None:
+        try:
+            retry_after = float(response.headers.get("retry-after"))
+        except (TypeError, ValueError):
+            retry_after = None
+    if retry_after is not None:
+        return min(retry_after, RETRY_MAX_DELAY)
+    # Full jitter keeps retrying workers from synchronising on a degraded provider.
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt)))
+
+
+def chat_completion(deadline=None, **kwargs):
+    """Call chat.completions.create with a bounded timeout, jittered retries and the circuit breaker.
+
+    ``deadline`` is an absolute ``time.monotonic()`` value; no attempt or backoff is allowed to outlive it.
+    """
+    import openai
+
+    for attempt in range(MAX_RETRIES + 1):
+        timeout = READ_TIMEOUT
+        if deadline is not None:
+            timeout = min(timeout, deadline - time.monotonic())
+            if timeout <= 0:
+                raise AIServiceTimeout("Request budget exhausted before calling OpenAI")
+        client = get_client()
+
+        # Nothing may leave between allow() and the request: a half-open breaker would keep
+        # its probe slot forever if the probe never reported success or failure.
+        if not breaker.allow():
+            metrics.incr("openai_circuit_open_rejections")
+            raise AIServiceUnavailable("OpenAI circuit breaker is open")
+
+        started = time.monotonic()
+        try:
+            response = client.chat.completions.create(timeout=timeout, **kwargs)
+        except Exception as e:
+            if not _is_retryable(e):
+                breaker.record_success()
+                raise AIServiceError(f"OpenAI request failed: {e}") from e
+
+            breaker.record_failure()
+            metrics.incr("openai_failures")
+
+            delay = _retry_delay(attempt, e)
+            out_of_time = deadline is not None and time.monotonic() + delay >= deadline
+            if attempt == MAX_RETRIES or out_of_time:
+                if isinstance(e, openai.APITimeoutError) or out_of_time:
+                    raise AIServiceTimeout(f"OpenAI request timed out: {e}") from e
+                raise AIServiceUnavailable(f"OpenAI is unavailable: {e}") from e
+
+            metrics.incr("openai_retries")
+            logger.warning("openai retry", extra={"fields": {
+                "attempt": attempt + 1,
+                "delay_ms": int(delay * 1000),
+                "error_type": type(e).__name__
+            }})
+            time.sleep(delay)
+            continue
+
+        breaker.record_success()
+        duration_ms = int((time.monotonic() - started) * 1000)
+        metrics.incr("openai_requests")
+        metrics.incr("openai_latency_ms", duration_ms)
+        logger.info("openai call", extra={"fields": {
+            "model": kwargs.get("model"),
+            "attempt": attempt + 1,
+            "duration_ms": duration_ms
+        }})
+        return response
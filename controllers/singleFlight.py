@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from controllers import metrics
+
+# Set to a directory shared by the workers on one host to also deduplicate across processes.
+SHARED_DIR = os.getenv("SINGLE_FLIGHT_DIR")
+RESULT_TTL_SECONDS = float(os.getenv("SINGLE_FLIGHT_RESULT_TTL_SECONDS", 60))
+# How often a worker clears expired result and lock files out of SHARED_DIR.
+SWEEP_INTERVAL_SECONDS = float(os.getenv("SINGLE_FLIGHT_SWEEP_INTERVAL_SECONDS", 300))
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+def hash_stream(stream, *extra):
+    """Hash a seekable stream's content (plus any extra key parts) and rewind it."""
+    digest = hashlib.sha256()
+    stream.seek(0)
+    for chunk in iter(lambda: stream.read(HASH_CHUNK_SIZE), b''):
+        digest.update(chunk)
+    stream.seek(0)
+    for part in extra:
+        digest.update(b'\0' + str(part).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class SingleFlight:
+    """Collapses concurrent calls with the same key into one execution whose result they all share."""
+
+    def __init__(self, name, shared_dir=SHARED_DIR, result_ttl=RESULT_TTL_SECONDS,
+                 sweep_interval=SWEEP_INTERVAL_SECONDS):
+        self.name = name
+        self.shared_dir = shared_dir if fcntl is not None else None
+        self.result_ttl = result_ttl
+        self.sweep_interval = sweep_interval
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._last_sweep = 0.0
+
+    def do(self, key, fn):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+
+        if not leader:
+            metrics.incr(f"{self.name}_single_flight_shared")
+            return future.result()
+
+        metrics.incr(f"{self.name}_single_flight_leaders")
+        try:
+            result = self._run_shared(key, fn) if self.shared_dir else fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def _run_shared(self, key, fn):
+        # One leader per host: the others block on the lock file, then pick up the leader's
+        # result file instead of recomputing it. Failures are not shared; the next holder retries.
+        os.makedirs(self.shared_dir, exist_ok=True)
+        self._sweep_if_due()
+        result_path = os.path.join(self.shared_dir, f"{self.name}-{key}.json")
+        with open(os.path.join(self.shared_dir, f"{self.name}-{key}.lock"), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                cached = self._read_result(result_path)
+                if cached is not None:
+                    metrics.incr(f"{self.name}_single_flight_cross_worker_hits")
+                    return cached
+
+                result = fn()
+                partial_path = f"{result_path}.{os.getpid()}"
+                with open(partial_path, 'w') as f:
+                    json.dump(result, f)
+                os.replace(partial_path, result_path)
+                return result
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _sweep_if_due(self):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_sweep < self.sweep_interval:
+                return
+            self._last_sweep = now
+        self.sweep()
+
+    def sweep(self):
+        """Remove this flight's files in the shared directory that are older than the result TTL.
+
+        Every distinct key leaves a lock file and a result file behind. A lock file is only
+        removed if it can be taken without waiting, so one in use by a live call is kept.
+        """
+        cutoff = time.time() - self.result_ttl
+        try:
+            names = os.listdir(self.shared_dir)
+        except OSError:
+            return
+        for name in names:
+            if not name.startswith(f"{self.name}-"):
+                continue
+            path = os.path.join(self.shared_dir, name)
+            try:
+                if os.path.getmtime(path) > cutoff:
+                    continue
+                if name.endswith(".lock"):
+                    with open(path, 'a') as lock_file:
+                        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        os.remove(path)
+                else:
+                    os.remove(path)
+                metrics.incr(f"{self.name}_single_flight_files_swept")
+            except OSError:
+                continue
+
+    def _read_result(self, path):
+        try:
+            if time.time() - os.path.getmtime(path) > self.result_ttl:
+                os.remove(path)
+                return None
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
@@ -0,0 +1,160 @@
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from flask import g, request
+
+from controllers import metrics
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Fraction of DEBUG records kept; high-volume debug events would otherwise swamp the queue.
+DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", 0.05))
+QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+
+request_id_var = contextvars.ContextVar("request_id", default="-")
+
+REDACTED = "[REDACTED]"
+SECRET_PATTERNS = (
+    re.compile(r'(?i)(bearer\s+)[A-Za-z0-9\-._~+/]+=*'),
+    re.compile(r'(?i)((?:token|password|api_key|apikey|secret)=)[^&\s]+'),
+    re.compile(r'(?i)(key\s+)[A-Za-z0-9]{16,}'),
+    re.compile(r'()eyJ[A-Za-z0-9_-]+\.[A-Za-z0-9_-]+\.[A-Za-z0-9_-]*'),
+    re.compile(r'()sk-[A-Za-z0-9_-]{16,}'),
+)
+SECRET_FIELDS = {"token", "reset_token", "password", "authorization", "api_key", "secret"}
+
+
+def redact(value):
+    if isinstance(value, str):
+        for pattern in SECRET_PATTERNS:
+            value = pattern.sub(lambda match: match.group(1) + REDACTED, value)
+        return value
+    if isinstance(value, dict):
+        return {key: REDACTED if key.lower() in SECRET_FIELDS else redact(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(item) for item in value]
+    return value
+
+
+class ContextFilter(logging.Filter):
+    """Runs on the calling thread: stamps the request id, samples DEBUG and redacts secrets
+    before the record is handed to the background writer."""
+
+    def filter(self, record):
+        if record.levelno <= logging.DEBUG and random.random() >= DEBUG_SAMPLE_RATE:
+            return False
+        record.request_id = request_id_var.get()
+        record.msg = redact(record.getMessage())
+        record.args = None
+        record.fields = redact(getattr(record, "fields", {}))
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "request_id": getattr(record, "request_id", "-"),
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class DroppingQueueHandler(QueueHandler):
+    # Never block a request thread on logging: if the writer falls behind, drop and count.
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.incr("log_records_dropped")
+
+    def prepare(self, record):
+        # The stock prepare() formats the whole record on the calling thread; only the
+        # traceback needs rendering here, the JSON is built by the listener.
+        record = copy.copy(record)
+        if record.exc_info:
+            record.exc_text = redact(logging.Formatter().formatException(record.exc_info))
+            record.exc_info = None
+        return record
+
+
+_listener = None
+
+
+def setup_logging(level=LOG_LEVEL):
+    global _listener
+    if _listener is not None:
+        return
+
+    log_queue = queue.Queue(maxsize=QUEUE_SIZE)
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter())
+
+    queue_handler = DroppingQueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(level)
+
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def restart_logging():
+    # The listener thread does not survive a fork; each worker starts its own.
+    global _listener
+    _listener = None
+    setup_logging()
+
+
+def get_logger(name):
+    return logging.getLogger(name)
+
+
+def submit(executor, fn, *args, **kwargs):
+    """executor.submit that carries the request id (and other context) into the worker thread."""
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def init_app(app):
+    @app.before_request
+    def assign_request_id():
+        request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+        request_id_var.set(request_id[:64])
+        g.request_started = time.monotonic()
+
+    @app.after_request
+    def add_request_id(response):
+        response.headers["X-Request-ID"] = request_id_var.get()
+        get_logger("request").debug("request completed", extra={"fields": {
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "duration_ms": int((time.monotonic() - g.get("request_started", time.monotonic())) * 1000),
+        }})
+        return response
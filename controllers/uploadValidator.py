@@ -0,0 +1,74 @@
+import os
+
+from PIL import Image, UnidentifiedImageError
+
+from controllers import metrics
+
+MAX_UPLOAD_BYTES = int(float(os.getenv("MAX_UPLOAD_MB", 10)) * 1024 * 1024)
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", 40_000_000))
+
+# PIL's own bomb check is a backstop; open_upload rejects oversized images before decoding.
+Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+
+SNIFF_BYTES = 16
+IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', 'jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+    (b'BM', 'bmp'),
+)
+
+
+class UploadRejected(Exception):
+    def __init__(self, reason, message, status=400):
+        super().__init__(message)
+        self.reason = reason
+        self.message = message
+        self.status = status
+
+
+def reject(reason, message, status=400):
+    metrics.incr("upload_rejected")
+    metrics.incr(f"upload_rejected_{reason}")
+    return UploadRejected(reason, message, status)
+
+
+def sniff_image_type(head):
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    for signature, kind in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return kind
+    return None
+
+
+def open_upload(file):
+    """Validate an uploaded FileStorage and return a lazily decoded PIL image.
+
+    Only the first bytes and the image header are read before rejecting, so
+    non-images and decompression bombs never reach a full decode.
+    """
+    stream = file.stream
+    head = stream.read(SNIFF_BYTES)
+    stream.seek(0)
+
+    if not head:
+        raise reject("empty", "Uploaded file is empty.")
+    if sniff_image_type(head) is None:
+        raise reject("unsupported_type", "Uploaded file is not a supported image.", 415)
+
+    try:
+        img = Image.open(stream)
+    except Image.DecompressionBombError:
+        # PIL refuses outright anything over twice its limit, before we see the size.
+        raise reject("too_many_pixels", f"Image exceeds the {MAX_IMAGE_PIXELS} pixel limit.", 413)
+    except (UnidentifiedImageError, OSError):
+        raise reject("invalid_image", "Uploaded file could not be read as an image.")
+
+    width, height = img.size
+    if width * height > MAX_IMAGE_PIXELS:
+        raise reject("too_many_pixels", f"Image exceeds the {MAX_IMAGE_PIXELS} pixel limit.", 413)
+
+    metrics.incr("upload_accepted")
+    return img
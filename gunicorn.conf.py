@@ -0,0 +1,65 @@
+import multiprocessing
+import os
+
+# Production entry point: `gunicorn` picks this file up from the working directory.
+# app.py builds the app at import, so serve that instance rather than building a second one.
+wsgi_app = "app:app"
+bind = f"0.0.0.0:{os.getenv('PORT', 5000)}"
+
+# The app mostly waits on Clarifai, OpenAI and Postgres, so a few threads per process
+# keep the cores busy without multiplying memory.
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", 4))
+
+# Import the app once in the master so workers share its pages copy-on-write.
+preload_app = True
+
+ANALYZE_BUDGET_SECONDS = float(os.getenv("ANALYZE_BUDGET_SECONDS", 60))
+timeout = int(ANALYZE_BUDGET_SECONDS + 30)
+# On SIGTERM workers stop accepting and get this long to finish in-flight analyses.
+graceful_timeout = int(ANALYZE_BUDGET_SECONDS + 15)
+keepalive = 5
+
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 1000))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", 100))
+MAX_WORKER_RSS_MB = int(os.getenv("GUNICORN_MAX_WORKER_RSS_MB", 512))
+
+accesslog = "-"
+errorlog = "-"
+
+
+def current_rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        import resource
+        # ru_maxrss is the peak, in KB on Linux, which is close enough where /proc is unavailable.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def on_starting(server):
+    import AI_API
+    AI_API.warm_imports()
+
+
+def post_fork(server, worker):
+    # gRPC channels and HTTP connection pools must never be shared across a fork;
+    # drop anything the master might hold so each worker builds its own on first use.
+    import AI_API
+    from controllers import analysisPipeline, historyCache, openaiClient, structuredLogging
+    structuredLogging.restart_logging()
+    AI_API.reset_clients()
+    analysisPipeline.reset_executor()
+    openaiClient.reset_client()
+    historyCache.reset_backend()
+
+
+def post_request(worker, req, environ, resp):
+    rss = current_rss_mb()
+    if rss > MAX_WORKER_RSS_MB and worker.alive:
+        worker.log.warning("Worker %s using %.0f MB (limit %d MB), recycling", worker.pid, rss, MAX_WORKER_RSS_MB)
+        # Lets in-flight requests finish, then the arbiter replaces the worker.
+        worker.alive = False
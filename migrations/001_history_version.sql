@@ -0,0 +1,2 @@
+-- Version counter backing the /history ETag; bumped on every history write and wipe.
+ALTER TABLE users ADD COLUMN IF NOT EXISTS history_version INTEGER NOT NULL DEFAULT 0;
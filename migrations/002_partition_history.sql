@@ -0,0 +1,65 @@
+-- Moves history to monthly range partitions on created_at so per-month data can be
+-- archived by dropping a partition instead of running large DELETEs.
+-- controllers/historyRetention.py keeps future partitions created and archives old ones.
+BEGIN;
+
+ALTER TABLE history ADD COLUMN IF NOT EXISTS created_at TIMESTAMPTZ NOT NULL DEFAULT NOW();
+ALTER TABLE history RENAME TO history_unpartitioned;
+
+CREATE TABLE history (
+    id BIGSERIAL,
+    user_id INTEGER NOT NULL,
+    history_entry JSONB NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+CREATE INDEX history_user_id_created_at_idx ON history (user_id, created_at, id);
+
+DO $$
+DECLARE
+    month DATE;
+BEGIN
+    FOR month IN
+        SELECT generate_series(
+            date_trunc('month', COALESCE((SELECT MIN(created_at) FROM history_unpartitioned), NOW())),
+            date_trunc('month', NOW()) + INTERVAL '3 months',
+            INTERVAL '1 month'
+        )::DATE
+    LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF history FOR VALUES FROM (%L) TO (%L)',
+            'history_' || to_char(month, 'YYYY_MM'), month, month + INTERVAL '1 month'
+        );
+    END LOOP;
+END $$;
+
+-- Catches rows outside the created partitions if the retention job stops running.
+CREATE TABLE history_default PARTITION OF history DEFAULT;
+
+-- Pre-migration rows all share the created_at filled in above, so ids are assigned
+-- explicitly in the old insertion order (the old id if there is one, else the physical
+-- row order) and readers sort by (created_at, id).
+DO $$
+DECLARE
+    tiebreak TEXT := 'ctid';
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'history_unpartitioned' AND column_name = 'id'
+    ) THEN
+        tiebreak := 'id';
+    END IF;
+    EXECUTE format(
+        'INSERT INTO history (id, user_id, history_entry, created_at)
+         SELECT row_number() OVER (ORDER BY created_at, %1$s), user_id, history_entry::JSONB, created_at
+         FROM history_unpartitioned',
+        tiebreak
+    );
+END $$;
+
+SELECT setval(pg_get_serial_sequence('history', 'id'), COALESCE(MAX(id), 0) + 1, false) FROM history;
+
+DROP TABLE history_unpartitioned;
+
+COMMIT;
@@ -0,0 +1,29 @@
+-- The retention job detaches expired partitions with DETACH PARTITION ... CONCURRENTLY so it
+-- never blocks live /history traffic, which Postgres does not allow while the partitioned
+-- table has a default partition. Rows that landed in history_default are moved into monthly
+-- partitions; controllers/historyRetention.py keeps upcoming months created ahead of time.
+BEGIN;
+
+ALTER TABLE history DETACH PARTITION history_default;
+
+DO $$
+DECLARE
+    month DATE;
+BEGIN
+    FOR month IN
+        SELECT DISTINCT date_trunc('month', created_at)::DATE FROM history_default
+    LOOP
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS %I PARTITION OF history FOR VALUES FROM (%L) TO (%L)',
+            'history_' || to_char(month, 'YYYY_MM'), month, month + INTERVAL '1 month'
+        );
+    END LOOP;
+END $$;
+
+INSERT INTO history (id, user_id, history_entry, created_at)
+SELECT id, user_id, history_entry, created_at
+FROM history_default;
+
+DROP TABLE history_default;
+
+COMMIT;
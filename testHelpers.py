@@ -0,0 +1,13 @@
+from unittest.mock import MagicMock
+
+
+def make_concept(name, value):
+    """A stand-in for a Clarifai concept with just the fields the app reads."""
+    concept = MagicMock()
+    concept.name = name
+    concept.value = value
+    return concept
+
+
+def gpt_reply(name, calories):
+    return f'success:\n{{"name": "{name}", "calories": {calories}, "carbohydrates": 10, "protein": 5, "fat": 2}}'
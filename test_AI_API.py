@@ -1,7 +1,10 @@
 import unittest
 from unittest.mock import patch, MagicMock
 import base64
+import io
 import json
+import os
+from PIL import Image
 import AI_API  
 
 class TestFoodAnalyzer(unittest.TestCase):
@@ -68,5 +71,56 @@ class TestFoodAnalyzer(unittest.TestCase):
         result = food_analyzer.convert_to_json(string)
         self.assertEqual(result, "No JSON found in the string.")
 
+class TestVisionInput(unittest.TestCase):
+
+    def setUp(self):
+        self.image_path = "test_vision_image.jpg"
+        Image.new("RGB", (4000, 3000), (120, 80, 40)).save(self.image_path)
+        self.addCleanup(os.remove, self.image_path)
+
+    def test_estimate_image_tokens(self):
+        self.assertEqual(AI_API.estimate_image_tokens(4000, 3000, "low"), 85)
+        # 4000x3000 -> 2048x1536 -> 1024x768: 2x2 tiles
+        self.assertEqual(AI_API.estimate_image_tokens(4000, 3000, "high"), 85 + 170 * 4)
+
+    def test_prepare_low_detail_downscales(self):
+        image = AI_API.prepare_vision_image(self.image_path, "low")
+
+        self.assertEqual(image.detail, "low")
+        self.assertEqual(image.tokens, 85)
+        self.assertTrue(image.data_url.startswith("data:image/jpeg;base64,"))
+        decoded = Image.open(io.BytesIO(base64.b64decode(image.data_url.split(",", 1)[1])))
+        self.assertEqual(max(decoded.size), 512)
+
+    def test_prepare_high_detail_falls_back_to_low_over_budget(self):
+        self.assertEqual(AI_API.prepare_vision_image(self.image_path, "high", token_budget=800).detail, "high")
+        self.assertEqual(AI_API.prepare_vision_image(self.image_path, "high", token_budget=500).detail, "low")
+
+    def test_prepare_rejects_unknown_detail(self):
+        with self.assertRaises(ValueError):
+            AI_API.prepare_vision_image(self.image_path, "ultra")
+
+    @patch("AI_API.chat_completion")
+    def test_gpt_analyze_sends_image(self, mock_chat_completion):
+        mock_chat_completion.return_value = MagicMock(
+            choices=[MagicMock(message=MagicMock(content="success:\n{\"name\": \"Salad\"}"))]
+        )
+        image = AI_API.VisionImage("data:image/jpeg;base64,AAAA", "low", 85)
+
+        AI_API.GPT_Analyze("describe image", image)
+
+        content = mock_chat_completion.call_args.kwargs["messages"][0]["content"]
+        self.assertEqual(content[0], {"type": "text", "text": "describe image"})
+        self.assertEqual(content[1]["image_url"], {"url": "data:image/jpeg;base64,AAAA", "detail": "low"})
+
+    @patch("AI_API.chat_completion")
+    def test_gpt_analyze_rejects_reply_without_success(self, mock_chat_completion):
+        mock_chat_completion.return_value = MagicMock(
+            choices=[MagicMock(message=MagicMock(content="I cannot help with that"))]
+        )
+        with self.assertRaises(AI_API.AIResponseError):
+            AI_API.GPT_Analyze("describe image", AI_API.VisionImage("data:,", "low", 85))
+
+
 if __name__ == "__main__":
     unittest.main()
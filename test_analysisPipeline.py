@@ -0,0 +1,107 @@
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from controllers import analysisPipeline
+from controllers import metrics
+from testHelpers import make_concept, gpt_reply
+
+
+class TestAnalysisPipeline(unittest.TestCase):
+
+    def setUp(self):
+        metrics.reset()
+        patcher = patch("controllers.analysisPipeline.api.prepare_vision_image", return_value="vision-image")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_average_results(self):
+        result = analysisPipeline.average_results([
+            {"name": "Salad", "calories": 100},
+            {"name": "Salad", "calories": 151},
+        ])
+        self.assertEqual(result, {"name": "Salad", "calories": 126})
+
+    def test_average_results_empty(self):
+        with self.assertRaises(analysisPipeline.AveragingError):
+            analysisPipeline.average_results([])
+
+    def test_rerank_keeps_agreeing_samples(self):
+        results = [{"name": "Beef Lasagna"}, {"name": "Pad Thai"}]
+        concepts = [make_concept("lasagna", 0.97)]
+        self.assertEqual(analysisPipeline.rerank(results, concepts), [{"name": "Beef Lasagna"}])
+
+    def test_rerank_without_agreement_keeps_all(self):
+        results = [{"name": "Pad Thai"}]
+        self.assertEqual(analysisPipeline.rerank(results, [make_concept("sushi", 0.99)]), results)
+
+    @patch("controllers.analysisPipeline.api.GPT_Analyze")
+    @patch("controllers.analysisPipeline.api.get_concepts", return_value=[])
+    def test_sequential_averages_samples(self, mock_get_concepts, mock_gpt):
+        mock_gpt.side_effect = [gpt_reply("Stew", 100), gpt_reply("Stew", 200)] * 2
+
+        result = analysisPipeline.run_sequential("meal.jpeg", time.monotonic() + 5)
+
+        self.assertEqual(result["calories"], 150)
+        self.assertEqual(mock_gpt.call_count, analysisPipeline.SAMPLES)
+
+    @patch("controllers.analysisPipeline.api.GPT_Analyze")
+    @patch("controllers.analysisPipeline.api.get_concepts")
+    def test_sequential_known_dish_skips_gpt(self, mock_get_concepts, mock_gpt):
+        mock_get_concepts.return_value = [make_concept("pizza", 0.99)]
+
+        result = analysisPipeline.run_sequential("meal.jpeg", time.monotonic() + 5)
+
+        self.assertEqual(result["name"], "Pizza")
+        mock_gpt.assert_not_called()
+
+    @patch("controllers.analysisPipeline.api.GPT_Analyze")
+    @patch("controllers.analysisPipeline.api.get_concepts")
+    def test_sequential_wraps_sample_errors(self, mock_get_concepts, mock_gpt):
+        mock_get_concepts.return_value = []
+        mock_gpt.side_effect = ValueError("bad reply")
+
+        with self.assertRaises(analysisPipeline.SampleError) as context:
+            analysisPipeline.run_sequential("meal.jpeg", time.monotonic() + 5)
+        self.assertEqual(context.exception.iteration, 1)
+
+    @patch("controllers.analysisPipeline.api.GPT_Analyze")
+    @patch("controllers.analysisPipeline.api.get_concepts")
+    def test_overlap_starts_gpt_before_clarifai_returns(self, mock_get_concepts, mock_gpt):
+        gpt_started = threading.Event()
+
+        def slow_concepts(image_path):
+            self.assertTrue(gpt_started.wait(2))
+            return [make_concept("lasagna", 0.92)]
+
+        def gpt(prompt, image_path, deadline=None, **kwargs):
+            gpt_started.set()
+            return gpt_reply("Lasagna", 600) if mock_gpt.call_count % 2 else gpt_reply("Pad Thai", 300)
+
+        mock_get_concepts.side_effect = slow_concepts
+        mock_gpt.side_effect = gpt
+
+        with patch.object(analysisPipeline, "CONCEPT_GRACE_SECONDS", 2):
+            result = analysisPipeline.run_overlapped("meal.jpeg", time.monotonic() + 5)
+
+        self.assertEqual(result["name"], "Lasagna")
+        self.assertEqual(result["calories"], 600)
+        self.assertEqual(metrics.get("analysis_overlap_concepts_in_time"), 1)
+
+    @patch("controllers.analysisPipeline.api.GPT_Analyze", return_value=gpt_reply("Stew", 400))
+    @patch("controllers.analysisPipeline.api.get_concepts")
+    def test_overlap_late_concepts_are_ignored(self, mock_get_concepts, mock_gpt):
+        release = threading.Event()
+        mock_get_concepts.side_effect = lambda image_path: release.wait(2) and []
+
+        with patch.object(analysisPipeline, "CONCEPT_GRACE_SECONDS", 0.01):
+            result = analysisPipeline.run_overlapped("meal.jpeg", time.monotonic() + 5)
+        release.set()
+
+        self.assertEqual(result["calories"], 400)
+        self.assertEqual(metrics.get("analysis_overlap_concepts_late"), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
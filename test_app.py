@@ -1,12 +1,19 @@
 import os
+import subprocess
+import sys
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv() 
 
 import unittest
 from unittest.mock import patch, MagicMock
+import io
 import json
+from flask_jwt_extended import create_access_token
+from PIL import Image
 from app import app  
+from controllers import historyCache
 
 class AppTestCase(unittest.TestCase):
 
@@ -135,7 +142,7 @@ class AppTestCase(unittest.TestCase):
         """Test fetching user history."""
         mock_cursor = MagicMock()
         mock_db_conn.return_value.cursor.return_value = mock_cursor
-        mock_cursor.fetchall.return_value = [("history_entry_1",), ("history_entry_2",)]
+        mock_cursor.fetchall.return_value = [(1, "history_entry_1"), (1, "history_entry_2")]
 
         response = self.app.get("/history", headers={"Authorization": "Bearer mock_token"})  # Ensure valid token
 
@@ -143,6 +150,176 @@ class AppTestCase(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
 
 
+class UploadLimitTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = app.test_client()
+        with app.app_context():
+            self.headers = {"Authorization": f"Bearer {create_access_token(identity='1')}"}
+        self.max_content_length = app.config['MAX_CONTENT_LENGTH']
+
+    def tearDown(self):
+        app.config['MAX_CONTENT_LENGTH'] = self.max_content_length
+
+    def test_oversized_upload_rejected(self):
+        """Uploads over MAX_CONTENT_LENGTH get a 413 without being processed."""
+        app.config['MAX_CONTENT_LENGTH'] = 1024
+        response = self.app.post("/api/analyze-image", headers=self.headers, data={
+            "image": (io.BytesIO(b"\xff\xd8\xff" + b"\x00" * 4096), "meal.jpg")
+        })
+
+        self.assertEqual(response.status_code, 413)
+        self.assertIn("limit", response.get_json()["error"])
+
+    @patch("app.api.get_concepts")
+    def test_non_image_upload_rejected(self, mock_get_concepts):
+        """Files that are not images are rejected from their first bytes."""
+        response = self.app.post("/api/analyze-image", headers=self.headers, data={
+            "image": (io.BytesIO(b"plain text pretending to be a photo"), "meal.jpg")
+        })
+
+        self.assertEqual(response.status_code, 415)
+        mock_get_concepts.assert_not_called()
+
+    @patch("app.analysis_pipeline.analyze", return_value={"name": "Pizza", "calories": 300})
+    def test_upload_saved_under_content_hash(self, mock_analyze):
+        """The JPEG is named by content, not by the client's filename."""
+        buffer = io.BytesIO()
+        Image.new("RGB", (8, 8)).save(buffer, "PNG")
+        response = self.app.post("/api/analyze-image", headers=self.headers, data={
+            "image": (io.BytesIO(buffer.getvalue()), "meal.png")
+        })
+
+        self.assertEqual(response.status_code, 200)
+        image_path = mock_analyze.call_args[0][0]
+        self.assertNotIn("meal", os.path.basename(image_path))
+        self.assertTrue(os.path.exists(image_path))
+        os.remove(image_path)
+
+    def test_save_as_jpeg_replaces_file_atomically(self):
+        """A reader holding the previous file keeps its full content; no partial files remain."""
+        from app import save_as_jpeg
+        with tempfile.TemporaryDirectory() as upload_dir:
+            image_path = os.path.join(upload_dir, "meal.jpeg")
+            save_as_jpeg(Image.new("RGB", (8, 8)), image_path)
+            with open(image_path, "rb") as reader:
+                before = os.path.getsize(image_path)
+                save_as_jpeg(Image.new("RGBA", (16, 16)), image_path)
+                self.assertEqual(len(reader.read()), before)
+
+            self.assertEqual(os.listdir(upload_dir), ["meal.jpeg"])
+
+
+class HistoryCachingTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = app.test_client()
+        with app.app_context():
+            self.headers = {"Authorization": f"Bearer {create_access_token(identity='1')}"}
+        historyCache.invalidate("1")
+
+    @patch("app.get_db_connection")
+    def test_history_sets_etag(self, mock_db_conn):
+        """History responses carry an ETag derived from the user's history version."""
+        mock_cursor = MagicMock()
+        mock_db_conn.return_value.cursor.return_value = mock_cursor
+        mock_cursor.fetchone.return_value = (3,)
+        mock_cursor.fetchall.return_value = [(3, {"name": "Pizza"})]
+
+        response = self.app.get("/history", headers=self.headers)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_etag(), ("history-1-3", False))
+        self.assertEqual(response.get_json()["history"], [{"name": "Pizza"}])
+
+    @patch("app.get_db_connection")
+    def test_history_not_modified(self, mock_db_conn):
+        """A matching If-None-Match returns 304 without querying the history table."""
+        mock_cursor = MagicMock()
+        mock_db_conn.return_value.cursor.return_value = mock_cursor
+        mock_cursor.fetchone.return_value = (3,)
+
+        response = self.app.get("/history", headers=dict(self.headers, **{"If-None-Match": '"history-1-3-gzip"'}))
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(mock_cursor.execute.call_count, 1)
+        mock_cursor.fetchall.assert_not_called()
+
+    @patch("app.get_db_connection")
+    def test_history_served_from_cache(self, mock_db_conn):
+        """A second fetch at the same version is served from the per-user cache."""
+        mock_cursor = MagicMock()
+        mock_db_conn.return_value.cursor.return_value = mock_cursor
+        mock_cursor.fetchone.return_value = (5,)
+        mock_cursor.fetchall.return_value = [(5, {"name": "Pizza"})]
+
+        self.app.get("/history", headers=self.headers)
+        response = self.app.get("/history", headers=self.headers)
+
+        self.assertEqual(response.get_json()["history"], [{"name": "Pizza"}])
+        mock_cursor.fetchall.assert_called_once()
+
+    @patch("app.get_db_connection")
+    def test_history_shared_cache_skips_database(self, mock_db_conn):
+        """With a shared cache backend, a hit is served without connecting to Postgres."""
+        shared = MagicMock()
+        shared.get.return_value = b'{"version": 6, "history": [{"name": "Sushi"}]}'
+        with patch.object(historyCache, "get_shared_backend", return_value=shared):
+            response = self.app.get("/history", headers=self.headers)
+            not_modified = self.app.get("/history", headers=dict(self.headers, **{"If-None-Match": '"history-1-6"'}))
+
+        self.assertEqual(response.get_json()["history"], [{"name": "Sushi"}])
+        self.assertEqual(response.get_etag(), ("history-1-6", False))
+        self.assertEqual(not_modified.status_code, 304)
+        mock_db_conn.assert_not_called()
+
+    @patch("app.get_db_connection")
+    def test_history_post_bumps_version(self, mock_db_conn):
+        """Adding a history entry bumps the version in the same transaction."""
+        mock_cursor = MagicMock()
+        mock_db_conn.return_value.cursor.return_value = mock_cursor
+        mock_cursor.fetchone.side_effect = [({"name": "Pizza"},), (4,)]
+
+        response = self.app.post("/history", headers=self.headers, json={"history_entry": {"name": "Pizza"}})
+
+        self.assertEqual(response.status_code, 201)
+        self.assertIn("history_version", mock_cursor.execute.call_args_list[-1][0][0])
+        mock_db_conn.return_value.commit.assert_called_once()
+
+    @patch("app.history_retention.wipe_user_history", side_effect=Exception("connection lost"))
+    @patch("app.get_db_connection")
+    def test_failed_wipe_still_bumps_version(self, mock_db_conn, mock_wipe):
+        """A wipe that fails partway still moves the version and drops the cached list."""
+        mock_cursor = MagicMock()
+        mock_db_conn.return_value.cursor.return_value = mock_cursor
+        mock_cursor.fetchone.side_effect = [(7,), (8,)]
+        historyCache.put("1", 6, [{"name": "Pizza"}])
+
+        response = self.app.get("/wipe", headers=self.headers)
+
+        self.assertEqual(response.status_code, 500)
+        bumps = [call for call in mock_cursor.execute.call_args_list if "history_version" in call[0][0]]
+        self.assertEqual(len(bumps), 2)
+        self.assertEqual(mock_db_conn.return_value.commit.call_count, 2)
+        self.assertIsNone(historyCache.get("1", 6))
+
+
+class StartupTestCase(unittest.TestCase):
+
+    def test_import_defers_ai_clients(self):
+        """Importing the app must not load openai or the Clarifai protobuf stack."""
+        code = (
+            "import sys, app; "
+            "print(','.join(m for m in ('openai', 'httpx', 'clarifai_grpc') if m in sys.modules))"
+        )
+        env = dict(os.environ, JWT_SECRET=os.getenv("JWT_SECRET", "test-secret"))
+        output = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True)
+        self.assertEqual(output.stdout.strip(), "")
+
+    def test_create_app_returns_new_app(self):
+        from app import create_app
+        self.assertIsNot(create_app(), app)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,57 @@
+import gzip
+import unittest
+from unittest.mock import patch
+
+from flask import Flask, jsonify
+
+from controllers import compression
+
+
+def make_app():
+    app = Flask(__name__)
+    compression.init_app(app)
+
+    @app.route('/large')
+    def large():
+        response = jsonify({"history": [{"name": "Pizza", "calories": 300}] * 100})
+        response.set_etag("history-1-2")
+        return response
+
+    @app.route('/small')
+    def small():
+        return jsonify({"message": "ok"})
+
+    return app
+
+
+class TestCompression(unittest.TestCase):
+
+    def setUp(self):
+        self.client = make_app().test_client()
+
+    @patch.object(compression, "brotli", None)
+    def test_gzip_large_json(self):
+        response = self.client.get('/large', headers={"Accept-Encoding": "gzip, deflate"})
+
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response.headers["Vary"])
+        self.assertEqual(response.get_etag(), ("history-1-2-gzip", False))
+        self.assertIn(b"Pizza", gzip.decompress(response.get_data()))
+
+    def test_no_accept_encoding_left_uncompressed(self):
+        response = self.client.get('/large', headers={"Accept-Encoding": "identity"})
+
+        self.assertNotIn("Content-Encoding", response.headers)
+        self.assertEqual(response.get_etag(), ("history-1-2", False))
+
+    def test_small_response_left_uncompressed(self):
+        response = self.client.get('/small', headers={"Accept-Encoding": "gzip"})
+        self.assertNotIn("Content-Encoding", response.headers)
+
+    @patch.object(compression, "brotli", None)
+    def test_etag_variants(self):
+        self.assertEqual(compression.etag_variants("history-1-2"), ["history-1-2", "history-1-2-gzip"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+import importlib.util
+import os
+import unittest
+from unittest.mock import patch, MagicMock
+
+spec = importlib.util.spec_from_file_location(
+    "gunicorn_conf", os.path.join(os.path.dirname(os.path.abspath(__file__)), "gunicorn.conf.py")
+)
+gunicorn_conf = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(gunicorn_conf)
+
+
+class TestGunicornConf(unittest.TestCase):
+
+    def test_preloads_app(self):
+        self.assertTrue(gunicorn_conf.preload_app)
+        self.assertEqual(gunicorn_conf.wsgi_app, "app:app")
+        self.assertGreaterEqual(gunicorn_conf.workers, 1)
+        self.assertGreater(gunicorn_conf.graceful_timeout, gunicorn_conf.ANALYZE_BUDGET_SECONDS)
+
+    def test_current_rss_mb(self):
+        self.assertGreater(gunicorn_conf.current_rss_mb(), 0)
+
+    def test_post_request_recycles_worker_over_memory_limit(self):
+        worker = MagicMock(alive=True)
+        with patch.object(gunicorn_conf, "current_rss_mb", return_value=gunicorn_conf.MAX_WORKER_RSS_MB + 1):
+            gunicorn_conf.post_request(worker, None, {}, None)
+        self.assertFalse(worker.alive)
+
+    def test_post_request_keeps_worker_under_limit(self):
+        worker = MagicMock(alive=True)
+        with patch.object(gunicorn_conf, "current_rss_mb", return_value=1):
+            gunicorn_conf.post_request(worker, None, {}, None)
+        self.assertTrue(worker.alive)
+
+    @patch("controllers.openaiClient.reset_client")
+    @patch("AI_API.reset_clients")
+    def test_post_fork_resets_clients(self, mock_reset_clients, mock_reset_client):
+        gunicorn_conf.post_fork(MagicMock(), MagicMock())
+        mock_reset_clients.assert_called_once()
+        mock_reset_client.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
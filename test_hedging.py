@@ -0,0 +1,96 @@
+import threading
+import time
+import unittest
+
+from controllers import metrics
+from controllers.hedging import Hedger, LatencyTracker
+
+
+class TestLatencyTracker(unittest.TestCase):
+
+    def test_percentile_needs_samples(self):
+        tracker = LatencyTracker()
+        tracker.add(1.0)
+        self.assertIsNone(tracker.percentile(0.95))
+
+        tracker = LatencyTracker()
+        for value in range(100):
+            tracker.add(value / 100)
+        self.assertAlmostEqual(tracker.percentile(0.95, min_samples=10), 0.95)
+
+
+class TestHedger(unittest.TestCase):
+
+    def setUp(self):
+        metrics.reset()
+
+    def test_fast_call_is_not_hedged(self):
+        hedger = Hedger("test", default_delay=0.5)
+        self.assertEqual(hedger.call(lambda: "ok"), "ok")
+        self.assertEqual(metrics.get("test_hedges_issued"), 0)
+
+    def test_slow_call_is_hedged_and_hedge_wins(self):
+        hedger = Hedger("test", default_delay=0.05)
+        calls = []
+        release = threading.Event()
+
+        def call():
+            calls.append(None)
+            if len(calls) == 1:
+                release.wait(2)
+                return "primary"
+            return "hedge"
+
+        self.assertEqual(hedger.call(call), "hedge")
+        release.set()
+        self.assertEqual(metrics.get("test_hedges_issued"), 1)
+        self.assertEqual(metrics.get("test_hedges_won"), 1)
+
+    def test_budget_limits_hedges(self):
+        hedger = Hedger("test", default_delay=0.01, max_hedge_ratio=0, burst=1)
+
+        def slow():
+            time.sleep(0.05)
+            return "ok"
+
+        for _ in range(3):
+            hedger.call(slow)
+        self.assertEqual(metrics.get("test_hedges_issued"), 1)
+        self.assertEqual(hedger.stats()["requests"], 3)
+
+    def test_budget_refills_on_fast_calls(self):
+        # One slow call in four with a 0.25 ratio: the fast calls in between pay for every hedge.
+        hedger = Hedger("test", default_delay=0.01, max_hedge_ratio=0.25, burst=1)
+
+        for i in range(12):
+            delay = 0.05 if i % 4 == 3 else 0
+            hedger.call(lambda delay=delay: time.sleep(delay) or "ok")
+        self.assertEqual(metrics.get("test_hedges_issued"), 3)
+
+    def test_failed_primary_falls_back_to_hedge(self):
+        hedger = Hedger("test", default_delay=0.01)
+        calls = []
+
+        def call():
+            calls.append(None)
+            if len(calls) == 1:
+                time.sleep(0.05)
+                raise RuntimeError("primary failed")
+            time.sleep(0.1)
+            return "hedge"
+
+        self.assertEqual(hedger.call(call), "hedge")
+
+    def test_both_failing_raises(self):
+        hedger = Hedger("test", default_delay=0.01)
+
+        def call():
+            time.sleep(0.02)
+            raise RuntimeError("down")
+
+        with self.assertRaises(RuntimeError):
+            hedger.call(call)
+
+
+if __name__ == "__main__":
+    unittest.main()
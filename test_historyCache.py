@@ -0,0 +1,91 @@
+import unittest
+from unittest.mock import patch, MagicMock
+
+from controllers import historyCache
+from controllers import metrics
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_evicts_least_recently_used_by_size(self):
+        cache = historyCache.LRUCache(max_bytes=10)
+        cache.set("a", 1, 4)
+        cache.set("b", 2, 4)
+        cache.get("a")
+        cache.set("c", 3, 4)
+
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.total_bytes, 8)
+
+    def test_skips_values_larger_than_cache(self):
+        cache = historyCache.LRUCache(max_bytes=10)
+        cache.set("a", 1, 11)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.total_bytes, 0)
+
+
+class TestHistoryCache(unittest.TestCase):
+
+    def setUp(self):
+        metrics.reset()
+        historyCache.invalidate(42)
+
+    def test_get_requires_matching_version(self):
+        historyCache.put(42, 1, [{"name": "Pizza"}])
+
+        self.assertEqual(historyCache.get(42, 1), [{"name": "Pizza"}])
+        self.assertIsNone(historyCache.get(42, 2))
+        self.assertEqual(historyCache.stats()["hit_ratio"], 0.5)
+
+    def test_append_writes_through(self):
+        historyCache.put(42, 1, [{"name": "Pizza"}])
+        historyCache.append(42, 2, {"name": "Salad"})
+
+        self.assertEqual(historyCache.get(42, 2), [{"name": "Pizza"}, {"name": "Salad"}])
+
+    def test_append_after_missed_write_invalidates(self):
+        historyCache.put(42, 1, [{"name": "Pizza"}])
+        historyCache.append(42, 3, {"name": "Salad"})
+
+        self.assertIsNone(historyCache.get(42, 1))
+        self.assertIsNone(historyCache.get(42, 3))
+
+    def test_shared_backend_fills_local_cache(self):
+        shared = MagicMock()
+        shared.get.return_value = b'{"version": 7, "history": [{"name": "Sushi"}]}'
+        with patch.object(historyCache, "get_shared_backend", return_value=shared):
+            self.assertEqual(historyCache.get(42, 7), [{"name": "Sushi"}])
+        self.assertEqual(historyCache.get(42, 7), [{"name": "Sushi"}])
+
+    def test_current_needs_shared_backend(self):
+        historyCache.put(42, 1, [{"name": "Pizza"}])
+        self.assertIsNone(historyCache.current(42))
+
+    def test_invalidate_with_version_keeps_version_in_shared_backend(self):
+        shared = MagicMock()
+        with patch.object(historyCache, "get_shared_backend", return_value=shared):
+            historyCache.invalidate(42, 8)
+
+        _, _, key, payload, version, _ = shared.eval.call_args[0]
+        self.assertEqual(key, "history:42")
+        self.assertEqual(payload, '{"version": 8, "history": null}')
+        self.assertEqual(version, 8)
+
+        shared.get.return_value = payload.encode()
+        with patch.object(historyCache, "get_shared_backend", return_value=shared):
+            self.assertEqual(historyCache.current(42)["version"], 8)
+            self.assertIsNone(historyCache.get(42, 8))
+
+
+    def test_failed_shared_write_drops_entry(self):
+        shared = MagicMock()
+        shared.eval.side_effect = ConnectionError("redis down")
+        with patch.object(historyCache, "get_shared_backend", return_value=shared):
+            historyCache.put(42, 9, [{"name": "Soup"}])
+
+        shared.delete.assert_called_once_with("history:42")
+
+
+if __name__ == "__main__":
+    unittest.main()
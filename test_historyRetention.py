@@ -0,0 +1,82 @@
+import gzip
+import os
+import tempfile
+import unittest
+from datetime import date
+from unittest.mock import patch, MagicMock
+
+from controllers import historyRetention
+
+
+class TestHistoryRetention(unittest.TestCase):
+
+    def test_add_months_wraps_years(self):
+        self.assertEqual(historyRetention.add_months(date(2025, 11, 1), 3), date(2026, 2, 1))
+        self.assertEqual(historyRetention.add_months(date(2025, 1, 1), -1), date(2024, 12, 1))
+
+    def test_expired_partitions(self):
+        names = ["history_2023_09", "history_2023_10", "history_2025_10", "history_default"]
+        expired = historyRetention.expired_partitions(names, date(2025, 10, 19), retention_months=24)
+        self.assertEqual(expired, ["history_2023_09"])
+
+    def test_ensure_partitions_creates_upcoming_months(self):
+        cur = MagicMock()
+        historyRetention.ensure_partitions(cur, date(2025, 12, 5), months_ahead=2)
+
+        bounds = [call.args[1] for call in cur.execute.call_args_list]
+        self.assertEqual(bounds, [
+            (date(2025, 12, 1), date(2026, 1, 1)),
+            (date(2026, 1, 1), date(2026, 2, 1)),
+            (date(2026, 2, 1), date(2026, 3, 1)),
+        ])
+
+    def test_wipe_user_history_deletes_in_batches(self):
+        conn = MagicMock()
+        cur = conn.cursor.return_value
+        rowcounts = iter([2, 2, 1])
+        cur.execute.side_effect = lambda *args: setattr(cur, "rowcount", next(rowcounts))
+
+        total = historyRetention.wipe_user_history(conn, 7, batch_size=2)
+
+        self.assertEqual(total, 5)
+        self.assertEqual(cur.execute.call_count, 3)
+        self.assertEqual(conn.commit.call_count, 3)
+
+    @patch("controllers.historyRetention.history_cache.invalidate")
+    def test_archive_partition_writes_gzip_and_drops(self, mock_invalidate):
+        conn = MagicMock()
+        cur = conn.cursor.return_value
+        cur.copy_expert.side_effect = lambda query, f: f.write(b"id,user_id\n1,7\n")
+        cur.fetchone.return_value = (False,)
+        cur.fetchall.return_value = [(7, 3)]
+
+        with tempfile.TemporaryDirectory() as archive_dir:
+            path = historyRetention.archive_partition(conn, "history_2023_09", archive_dir)
+
+            with gzip.open(path) as f:
+                self.assertEqual(f.read(), b"id,user_id\n1,7\n")
+            self.assertEqual(os.listdir(archive_dir), ["history_2023_09.csv.gz"])
+
+        statements = [str(call.args[0]) for call in cur.execute.call_args_list]
+        self.assertIn("CONCURRENTLY", statements[1])
+        self.assertIn("history_version", statements[2])
+        self.assertIn("DROP TABLE", statements[3])
+        self.assertFalse(conn.autocommit)
+        mock_invalidate.assert_called_once_with(7, 3)
+
+    @patch("controllers.historyRetention.history_cache.invalidate")
+    def test_archive_partition_finalizes_pending_detach(self, mock_invalidate):
+        conn = MagicMock()
+        cur = conn.cursor.return_value
+        cur.fetchone.return_value = (True,)
+        cur.fetchall.return_value = []
+
+        with tempfile.TemporaryDirectory() as archive_dir:
+            historyRetention.archive_partition(conn, "history_2023_09", archive_dir)
+
+        self.assertIn("FINALIZE", str(cur.execute.call_args_list[1].args[0]))
+        mock_invalidate.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,134 @@
+import time
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from controllers import analysisPipeline
+from controllers import metrics
+from controllers import modelRouter
+from controllers.modelRouter import CHEAP_MODEL, STRONG_MODEL, RoutingPlan
+from testHelpers import make_concept, gpt_reply
+
+
+class TestRoutingPlan(unittest.TestCase):
+
+    def setUp(self):
+        metrics.reset()
+
+    def test_routing_off_always_uses_strong_model(self):
+        plan = RoutingPlan(routing=False)
+        plan.set_concepts([make_concept("soup", 0.2)])
+        self.assertEqual(plan.next_model(), STRONG_MODEL)
+
+    def test_agreeing_cheap_samples_stay_cheap(self):
+        plan = RoutingPlan(routing=True)
+        plan.set_concepts([make_concept("soup", 0.95)])
+        plan.add_result(plan.next_model(), {"name": "Soup", "calories": 200})
+        plan.add_result(plan.next_model(), {"name": "soup", "calories": 210})
+
+        self.assertEqual(plan.next_model(), CHEAP_MODEL)
+        self.assertEqual(metrics.get("router_agreements"), 1)
+        self.assertEqual(modelRouter.stats()["agreement_rate"], 1.0)
+
+    def test_disagreement_escalates_and_averages_strong_only(self):
+        plan = RoutingPlan(routing=True)
+        plan.set_concepts([make_concept("soup", 0.95)])
+        plan.add_result(plan.next_model(), {"name": "Soup", "calories": 200})
+        plan.add_result(plan.next_model(), {"name": "Stew", "calories": 500})
+
+        self.assertEqual(plan.next_model(), STRONG_MODEL)
+        plan.add_result(STRONG_MODEL, {"name": "Stew", "calories": 450})
+        self.assertEqual(plan.final_results(), [{"name": "Stew", "calories": 450}])
+        self.assertEqual(metrics.get("router_escalations"), 1)
+
+    def test_low_confidence_goes_straight_to_strong_model(self):
+        plan = RoutingPlan(routing=True)
+        plan.set_concepts([make_concept("soup", 0.4)])
+        self.assertEqual(plan.next_model(), STRONG_MODEL)
+
+    def test_cost_budget_stops_after_first_sample(self):
+        plan = RoutingPlan(cost_budget=0.001, routing=True)
+        self.assertEqual(plan.next_model(), CHEAP_MODEL)
+        plan.spend(0.0009)
+        plan.add_result(CHEAP_MODEL, {"name": "Soup", "calories": 200})
+
+        self.assertIsNone(plan.next_model())
+        self.assertEqual(metrics.get("router_budget_stops"), 1)
+
+    def test_latency_budget_stops_when_too_little_time_is_left(self):
+        modelRouter.record_usage(STRONG_MODEL, None, 2.0)
+        plan = RoutingPlan(deadline=time.monotonic() + 1, routing=False)
+        self.assertEqual(plan.next_model(), STRONG_MODEL)
+        self.assertIsNone(plan.next_model())
+
+    def test_parallel_wave_respects_cost_budget(self):
+        plan = RoutingPlan(cost_budget=1e-6, routing=True)
+        self.assertEqual(plan.next_model(pending=0), CHEAP_MODEL)
+        self.assertIsNone(plan.next_model(pending=1))
+
+    def test_record_usage_tracks_tokens_and_cost(self):
+        usage = SimpleNamespace(prompt_tokens=1000, completion_tokens=100)
+        cost = modelRouter.record_usage("gpt-4o-mini", usage, 0.5)
+
+        self.assertAlmostEqual(cost, (1000 * 0.15 + 100 * 0.60) / 1_000_000)
+        self.assertEqual(metrics.get("gpt_model_gpt-4o-mini_prompt_tokens"), 1000)
+        self.assertEqual(metrics.get("gpt_model_gpt-4o-mini_latency_ms"), 500)
+
+
+class TestRoutedPipeline(unittest.TestCase):
+
+    def setUp(self):
+        metrics.reset()
+        for target, value in (
+            ("controllers.analysisPipeline.api.prepare_vision_image", "vision-image"),
+            ("controllers.analysisPipeline.api.generate_gpt_prompt", "prompt"),
+            ("controllers.analysisPipeline.nutrition_lookup.lookup", None),
+        ):
+            patcher = patch(target, return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = patch("controllers.modelRouter.ROUTING_ENABLED", True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch("controllers.analysisPipeline.api.GPT_Analyze")
+    @patch("controllers.analysisPipeline.api.get_concepts", return_value=[make_concept("curry", 0.95)])
+    def test_sequential_escalates_on_disagreement(self, mock_get_concepts, mock_gpt):
+        replies = {CHEAP_MODEL: iter([gpt_reply("Curry", 400), gpt_reply("Chili", 700)]),
+                   STRONG_MODEL: iter([gpt_reply("Curry", 500), gpt_reply("Curry", 520)])}
+        mock_gpt.side_effect = lambda prompt, image, deadline=None, model=None, plan=None: next(replies[model])
+
+        result = analysisPipeline.run_sequential("meal.jpeg", time.monotonic() + 5)
+
+        models = [call.kwargs["model"] for call in mock_gpt.call_args_list]
+        self.assertEqual(models, [CHEAP_MODEL, CHEAP_MODEL, STRONG_MODEL, STRONG_MODEL])
+        self.assertEqual(result["name"], "Curry")
+        self.assertEqual(result["calories"], 510)
+
+    @patch("controllers.analysisPipeline.api.GPT_Analyze")
+    @patch("controllers.analysisPipeline.api.get_concepts", return_value=[make_concept("curry", 0.95)])
+    def test_overlap_adds_strong_wave_on_disagreement(self, mock_get_concepts, mock_gpt):
+        def gpt(prompt, image, deadline=None, model=None, plan=None):
+            if model == STRONG_MODEL:
+                return gpt_reply("Curry", 480)
+            return gpt_reply("Chili", 700) if mock_gpt.call_count % 2 else gpt_reply("Curry", 400)
+
+        mock_gpt.side_effect = gpt
+        result = analysisPipeline.run_overlapped("meal.jpeg", time.monotonic() + 5)
+
+        models = [call.kwargs["model"] for call in mock_gpt.call_args_list]
+        self.assertEqual(models.count(STRONG_MODEL), modelRouter.ESCALATION_SAMPLES)
+        self.assertEqual(result["calories"], 480)
+
+    @patch("controllers.analysisPipeline.api.GPT_Analyze", return_value=gpt_reply("Curry", 400))
+    @patch("controllers.analysisPipeline.api.get_concepts", return_value=[make_concept("curry", 0.95)])
+    def test_overlap_first_wave_respects_cost_budget(self, mock_get_concepts, mock_gpt):
+        with patch("controllers.modelRouter.REQUEST_COST_BUDGET_USD", 1e-6):
+            result = analysisPipeline.run_overlapped("meal.jpeg", time.monotonic() + 5)
+
+        self.assertEqual(mock_gpt.call_count, 1)
+        self.assertEqual(result["calories"], 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
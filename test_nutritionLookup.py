@@ -0,0 +1,45 @@
+import unittest
+from controllers import metrics
+from controllers import nutritionLookup
+from testHelpers import make_concept
+
+
+class TestNutritionLookup(unittest.TestCase):
+
+    def setUp(self):
+        metrics.reset()
+
+    def test_load_index_includes_aliases(self):
+        index = nutritionLookup.load_index()
+        self.assertEqual(index["pizza"], index["pepperoni pizza"])
+        self.assertEqual(index["pizza"][0], "Pizza")
+
+    def test_find_dish_exact_and_fuzzy(self):
+        self.assertEqual(nutritionLookup.find_dish("Hamburger")["name"], "Hamburger")
+        self.assertEqual(nutritionLookup.find_dish("hamburgers")["name"], "Hamburger")
+        self.assertIsNone(nutritionLookup.find_dish("mystery stew"))
+
+    def test_generic_names_do_not_match_specific_dishes(self):
+        for name in ("green salad", "macaroni", "rice noodles", "fried fish", "kebab", "sub"):
+            self.assertIsNone(nutritionLookup.find_dish(name), name)
+
+    def test_lookup_hit_returns_macros(self):
+        result = nutritionLookup.lookup([make_concept("cheese", 0.97), make_concept("pizza", 0.99)])
+
+        self.assertEqual(result["name"], "Pizza")
+        self.assertEqual(set(result), {"name", "calories", "carbohydrates", "protein", "fat"})
+        self.assertEqual(nutritionLookup.stats()["hit_rate"], 1.0)
+
+    def test_lookup_low_confidence_misses(self):
+        result = nutritionLookup.lookup([make_concept("pizza", 0.6)])
+
+        self.assertIsNone(result)
+        self.assertEqual(nutritionLookup.stats()["hits"], 0)
+        self.assertEqual(nutritionLookup.stats()["requests"], 1)
+
+    def test_lookup_no_concepts(self):
+        self.assertIsNone(nutritionLookup.lookup([]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+import time
+import unittest
+from unittest.mock import patch, MagicMock
+
+import httpx
+import openai
+
+from controllers import openaiClient
+
+
+def make_status_error(error_class, status_code, headers=None):
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    response = httpx.Response(status_code, request=request, headers=headers or {})
+    return error_class("error", response=response, body=None)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def test_opens_after_threshold_and_probes_after_reset(self):
+        now = [0.0]
+        breaker = openaiClient.CircuitBreaker(2, 10, clock=lambda: now[0])
+
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+
+        now[0] = 11
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())  # only one probe at a time
+
+        breaker.record_success()
+        self.assertTrue(breaker.allow())
+
+    def test_failed_probe_reopens(self):
+        now = [0.0]
+        breaker = openaiClient.CircuitBreaker(1, 10, clock=lambda: now[0])
+        breaker.record_failure()
+        now[0] = 11
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+
+
+class TestChatCompletion(unittest.TestCase):
+
+    def setUp(self):
+        openaiClient.breaker.record_success()
+
+    @patch("controllers.openaiClient.time.sleep")
+    @patch("controllers.openaiClient.get_client")
+    def test_retries_rate_limit_then_succeeds(self, mock_get_client, mock_sleep):
+        create = mock_get_client.return_value.chat.completions.create
+        create.side_effect = [make_status_error(openai.RateLimitError, 429, {"retry-after": "1"}), "ok"]
+
+        result = openaiClient.chat_completion(model="gpt-4o", messages=[])
+
+        self.assertEqual(result, "ok")
+        self.assertEqual(create.call_count, 2)
+        mock_sleep.assert_called_once_with(1.0)
+
+    @patch("controllers.openaiClient.time.sleep")
+    @patch("controllers.openaiClient.get_client")
+    def test_exhausted_retries_raise_unavailable(self, mock_get_client, mock_sleep):
+        create = mock_get_client.return_value.chat.completions.create
+        create.side_effect = make_status_error(openai.InternalServerError, 503)
+
+        with self.assertRaises(openaiClient.AIServiceUnavailable):
+            openaiClient.chat_completion(model="gpt-4o", messages=[])
+        self.assertEqual(create.call_count, openaiClient.MAX_RETRIES + 1)
+
+    @patch("controllers.openaiClient.get_client")
+    def test_client_error_is_not_retried(self, mock_get_client):
+        create = mock_get_client.return_value.chat.completions.create
+        create.side_effect = make_status_error(openai.BadRequestError, 400)
+
+        with self.assertRaises(openaiClient.AIServiceError):
+            openaiClient.chat_completion(model="gpt-4o", messages=[])
+        self.assertEqual(create.call_count, 1)
+
+    @patch("controllers.openaiClient.get_client")
+    def test_timeout_is_bounded_by_deadline(self, mock_get_client):
+        create = mock_get_client.return_value.chat.completions.create
+        create.return_value = "ok"
+
+        openaiClient.chat_completion(deadline=time.monotonic() + 2, model="gpt-4o", messages=[])
+
+        self.assertLessEqual(create.call_args.kwargs["timeout"], 2)
+
+    @patch("controllers.openaiClient.get_client")
+    def test_expired_deadline_raises_timeout(self, mock_get_client):
+        with self.assertRaises(openaiClient.AIServiceTimeout):
+            openaiClient.chat_completion(deadline=time.monotonic() - 1, model="gpt-4o", messages=[])
+        mock_get_client.return_value.chat.completions.create.assert_not_called()
+
+    @patch("controllers.openaiClient.get_client")
+    def test_expired_deadline_does_not_take_breaker_probe(self, mock_get_client):
+        clock = [0.0]
+        breaker = openaiClient.CircuitBreaker(failure_threshold=1, reset_seconds=10, clock=lambda: clock[0])
+        breaker.record_failure()
+        clock[0] = 11
+
+        with patch.object(openaiClient, "breaker", breaker):
+            with self.assertRaises(openaiClient.AIServiceTimeout):
+                openaiClient.chat_completion(deadline=time.monotonic() - 1, model="gpt-4o", messages=[])
+
+        self.assertFalse(breaker.probing)
+        self.assertTrue(breaker.allow())
+
+    @patch("controllers.openaiClient.get_client")
+    def test_open_breaker_fails_fast(self, mock_get_client):
+        with patch.object(openaiClient.breaker, "allow", return_value=False):
+            with self.assertRaises(openaiClient.AIServiceUnavailable):
+                openaiClient.chat_completion(model="gpt-4o", messages=[])
+        mock_get_client.return_value.chat.completions.create.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import fcntl
+import io
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from controllers import metrics
+from controllers.singleFlight import SingleFlight, hash_stream
+
+
+class TestSingleFlight(unittest.TestCase):
+
+    def setUp(self):
+        metrics.reset()
+
+    def test_hash_stream_includes_extra_parts_and_rewinds(self):
+        stream = io.BytesIO(b"image bytes")
+        stream.read(3)
+
+        key = hash_stream(stream, "low")
+
+        self.assertEqual(stream.tell(), 0)
+        self.assertEqual(key, hash_stream(io.BytesIO(b"image bytes"), "low"))
+        self.assertNotEqual(key, hash_stream(io.BytesIO(b"image bytes"), "high"))
+
+    def test_concurrent_calls_share_one_execution(self):
+        flight = SingleFlight("test", shared_dir=None)
+        calls = []
+        started = threading.Event()
+        release = threading.Event()
+
+        def compute():
+            calls.append(None)
+            started.set()
+            release.wait(2)
+            return {"name": "Pizza"}
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(flight.do("key", compute)))
+        leader.start()
+        started.wait(2)
+        followers = [threading.Thread(target=lambda: results.append(flight.do("key", compute))) for _ in range(2)]
+        for follower in followers:
+            follower.start()
+        while metrics.get("test_single_flight_shared") < 2:
+            time.sleep(0.01)
+        release.set()
+        for thread in [leader] + followers:
+            thread.join(2)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{"name": "Pizza"}] * 3)
+
+    def test_errors_are_shared_but_not_remembered(self):
+        flight = SingleFlight("test", shared_dir=None)
+
+        def fail():
+            raise RuntimeError("upstream down")
+
+        with self.assertRaises(RuntimeError):
+            flight.do("key", fail)
+        self.assertEqual(flight.do("key", lambda: "ok"), "ok")
+
+    def test_shared_dir_reuses_result_across_instances(self):
+        with tempfile.TemporaryDirectory() as shared_dir:
+            first = SingleFlight("test", shared_dir=shared_dir)
+            second = SingleFlight("test", shared_dir=shared_dir)
+
+            self.assertEqual(first.do("key", lambda: {"calories": 300}), {"calories": 300})
+            self.assertEqual(second.do("key", lambda: {"calories": 999}), {"calories": 300})
+            self.assertEqual(metrics.get("test_single_flight_cross_worker_hits"), 1)
+
+    def test_shared_result_expires(self):
+        with tempfile.TemporaryDirectory() as shared_dir:
+            SingleFlight("test", shared_dir=shared_dir, result_ttl=-1).do("key", lambda: 1)
+            self.assertEqual(SingleFlight("test", shared_dir=shared_dir, result_ttl=-1).do("key", lambda: 2), 2)
+
+    def test_sweep_removes_expired_files_but_not_held_locks(self):
+        with tempfile.TemporaryDirectory() as shared_dir:
+            flight = SingleFlight("test", shared_dir=shared_dir, result_ttl=60)
+            for key in ("old", "new"):
+                flight.do(key, lambda: 1)
+            old = time.time() - 120
+            for name in ("test-old.json", "test-old.lock"):
+                os.utime(os.path.join(shared_dir, name), (old, old))
+
+            held_path = os.path.join(shared_dir, "test-held.lock")
+            with open(held_path, 'w') as held:
+                os.utime(held_path, (old, old))
+                fcntl.flock(held, fcntl.LOCK_EX)
+                flight.sweep()
+
+            self.assertEqual(sorted(os.listdir(shared_dir)), ["test-held.lock", "test-new.json", "test-new.lock"])
+
+
+if __name__ == "__main__":
+    unittest.main()
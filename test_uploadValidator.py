@@ -0,0 +1,70 @@
+import io
+import unittest
+from unittest.mock import patch
+
+from PIL import Image
+from werkzeug.datastructures import FileStorage
+
+from controllers import metrics
+from controllers import uploadValidator
+
+
+def make_upload(data, filename="meal.jpg"):
+    return FileStorage(stream=io.BytesIO(data), filename=filename)
+
+
+def make_image_bytes(size=(8, 8), fmt="JPEG"):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, (200, 100, 50)).save(buffer, fmt)
+    return buffer.getvalue()
+
+
+class TestUploadValidator(unittest.TestCase):
+
+    def setUp(self):
+        metrics.reset()
+
+    def test_sniff_image_type(self):
+        self.assertEqual(uploadValidator.sniff_image_type(make_image_bytes()[:16]), "jpeg")
+        self.assertEqual(uploadValidator.sniff_image_type(make_image_bytes(fmt="PNG")[:16]), "png")
+        self.assertEqual(uploadValidator.sniff_image_type(b"RIFF\x00\x00\x00\x00WEBPVP8 "), "webp")
+        self.assertIsNone(uploadValidator.sniff_image_type(b"%PDF-1.7"))
+
+    def test_open_upload_accepts_image(self):
+        img = uploadValidator.open_upload(make_upload(make_image_bytes(fmt="PNG")))
+        self.assertEqual(img.size, (8, 8))
+        self.assertEqual(metrics.get("upload_accepted"), 1)
+
+    def test_rejects_non_image_from_magic_bytes(self):
+        with self.assertRaises(uploadValidator.UploadRejected) as context:
+            uploadValidator.open_upload(make_upload(b"#!/bin/sh\necho not an image"))
+        self.assertEqual(context.exception.status, 415)
+        self.assertEqual(metrics.get("upload_rejected_unsupported_type"), 1)
+
+    def test_rejects_empty_upload(self):
+        with self.assertRaises(uploadValidator.UploadRejected) as context:
+            uploadValidator.open_upload(make_upload(b""))
+        self.assertEqual(context.exception.reason, "empty")
+
+    def test_rejects_truncated_image(self):
+        with self.assertRaises(uploadValidator.UploadRejected) as context:
+            uploadValidator.open_upload(make_upload(b"\x89PNG\r\n\x1a\n" + b"\x00" * 8))
+        self.assertEqual(context.exception.reason, "invalid_image")
+
+    def test_rejects_too_many_pixels_before_decode(self):
+        with patch.object(uploadValidator, "MAX_IMAGE_PIXELS", 100):
+            with self.assertRaises(uploadValidator.UploadRejected) as context:
+                uploadValidator.open_upload(make_upload(make_image_bytes(size=(20, 20))))
+        self.assertEqual(context.exception.status, 413)
+        self.assertEqual(metrics.get("upload_rejected"), 1)
+
+    def test_rejects_decompression_bomb_refused_by_pil(self):
+        with patch.object(Image, "MAX_IMAGE_PIXELS", 100):
+            with self.assertRaises(uploadValidator.UploadRejected) as context:
+                uploadValidator.open_upload(make_upload(make_image_bytes(size=(20, 20))))
+        self.assertEqual(context.exception.status, 413)
+        self.assertEqual(metrics.get("upload_rejected_too_many_pixels"), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()